@@ -0,0 +1,135 @@
+"""Build and query benchmark for the near-duplicate intent index.
+
+Indexes synthetic concepts (random combinations of real words and generated
+pseudo-words), then queries them with typos, plurals and rephrasings and reports
+query latency percentiles, build time and memory against a budget. It also
+checks that intents differing only in symbols ("C++" and "C") never match:
+
+    python benchmarks/intent_index_benchmark.py --size 30000 --queries 2000
+
+Real intents draw on a vocabulary of thousands of words. With --vocabulary 0
+only the ~200 real words are combined, so every trigram is shared by hundreds
+of concepts: a worst case that shows how latency degrades.
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(project_root / "src"), str(project_root)]
+
+from benchmarks.run_benchmark import percentile
+from utils.intent_index import IntentIndex
+
+QUERY_P99_BUDGET_MS = 1.0
+
+_WORDS = """
+quantum computing normal distribution photosynthesis blockchain black hole machine learning neural network
+supply demand inflation interest rate compound world war cold civil revolution french industrial
+immune system vaccine virus bacteria dna genetics evolution natural selection plate tectonics volcano
+earthquake climate change greenhouse effect carbon cycle water ocean current tide moon phase solar
+eclipse gravity relativity special general theory electricity magnetism circuit transistor semiconductor
+internet protocol encryption public key cryptography database index search engine compiler operating
+memory cache cpu gpu algorithm sorting graph tree hash table probability statistics regression bayes
+theorem calculus derivative integral limit matrix vector linear algebra game chess poker soccer
+basketball olympics democracy election constitution parliament federal reserve stock market bond option
+""".split()
+
+# (indexed, query, should match): concepts told apart only by their symbols must not match
+SYMBOL_CASES = [
+    ("C++ templates", "C templates", False),
+    ("C# templates", "C++ templates", False),
+    ("C templates", "C# templates", False),
+    ("A* search", "A search", False),
+    (".NET", "NET", False),
+    ("C++ template metaprogramming techniques", "C template metaprogramming techniques", False),
+    ("C++ templates", "what are C++ templates?", True),
+    ("TCP/IP", "explain TCP/IP to me", True),
+    ("Node.js event loop", "how does the node.js event loop work", True),
+]
+
+_SYLLABLES = "ba co di fe gu ha ji ko lu me no pa qui ro su te vi wo xa ze tion al er ic".split()
+
+def make_vocabulary(extra_words: int, rng: random.Random) -> list:
+    words = set(_WORDS)
+    while len(words) < len(_WORDS) + extra_words:
+        words.add(''.join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+def make_concepts(size: int, words: list, rng: random.Random) -> list:
+    concepts = set()
+    while len(concepts) < size:
+        concepts.add(' '.join(rng.sample(words, rng.randint(2, 4))))
+    return sorted(concepts)
+
+def perturb(concept: str, rng: random.Random) -> str:
+    """Return a typo, plural or rephrasing of a concept, as users type them."""
+    kind = rng.randrange(4)
+    if kind == 0:
+        i = rng.randrange(len(concept))
+        return concept[:i] + concept[i] + concept[i:]
+    if kind == 1:
+        return concept + 's'
+    if kind == 2:
+        return f"what is {concept}"
+    return f"how does {concept.title()} work?"
+
+def check_symbol_cases(threshold: float) -> int:
+    """Return the number of SYMBOL_CASES the index gets wrong, printing each."""
+    failures = 0
+    for indexed, query, should_match in SYMBOL_CASES:
+        index = IntentIndex()
+        index.add(indexed, "run")
+        matched = bool(index.search(query, threshold))
+        if matched != should_match:
+            failures += 1
+            print(f"symbol case failed: {query!r} {'should' if should_match else 'should not'} match {indexed!r}")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure build and query cost of the intent index.")
+    parser.add_argument('--size', type=int, default=30000, help="Number of indexed concepts")
+    parser.add_argument('--queries', type=int, default=2000, help="Number of timed queries")
+    parser.add_argument('--vocabulary', type=int, default=3000,
+                        help="Pseudo-words added to the real words (0 for the small-vocabulary worst case)")
+    parser.add_argument('--threshold', type=float, default=0.7, help="Similarity threshold")
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    concepts = make_concepts(args.size, make_vocabulary(args.vocabulary, rng), rng)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    index = IntentIndex()
+    for run_number, concept in enumerate(concepts):
+        index.add(concept, f"run_{run_number}")
+    build_seconds = time.perf_counter() - start
+    memory_mb = tracemalloc.get_traced_memory()[0] / 1e6
+    tracemalloc.stop()
+
+    latencies = []
+    found = 0
+    for _ in range(args.queries):
+        concept = rng.choice(concepts)
+        query = perturb(concept, rng)
+        start = time.perf_counter()
+        matches = index.search(query, args.threshold)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found += bool(matches) and matches[0]['user_intent'] == concept
+
+    p99 = percentile(latencies, 99)
+    print(f"indexed {len(index)} concepts in {build_seconds:.2f}s, {memory_mb:.1f} MB")
+    print(f"query ms: p50 {percentile(latencies, 50):.3f}  p95 {percentile(latencies, 95):.3f}  "
+          f"p99 {p99:.3f}  mean {statistics.mean(latencies):.3f}  (budget p99 {QUERY_P99_BUDGET_MS} ms)")
+    print(f"recall of the original concept: {found / args.queries:.1%}")
+    symbol_failures = check_symbol_cases(args.threshold)
+    print(f"symbol-only differences: {len(SYMBOL_CASES) - symbol_failures}/{len(SYMBOL_CASES)} cases correct")
+    sys.exit(0 if p99 <= QUERY_P99_BUDGET_MS and not symbol_failures else 1)
+
+if __name__ == "__main__":
+    main()
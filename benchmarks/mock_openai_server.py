@@ -0,0 +1,246 @@
+"""Local stand-in for the OpenAI chat and image endpoints, for offline benchmarks.
+
+Serves recorded YAML responses from benchmarks/fixtures (or their JSON
+equivalents when a json_schema response format is requested) with configurable
+latency, error rate and image payload size. Point the app at it with
+OPENAI_BASE_URL=http://127.0.0.1:<port>/v1.
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+from aiohttp import web
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+_IMAGE_DESCRIPTION_RE = re.compile(r'^(\s*"?image_description"?:\s*")(.*?)(",?\s*)$', re.MULTILINE)
+
+def load_fixtures(fixtures_dir: Path = FIXTURES_DIR, suffix: str = ".yaml") -> List[str]:
+    """Load the recorded completions used as chat responses."""
+    fixtures = [path.read_text(encoding='utf-8') for path in sorted(fixtures_dir.glob(f"*{suffix}"))]
+    if not fixtures:
+        raise FileNotFoundError(f"No fixtures found in {fixtures_dir}")
+    return fixtures
+
+def make_png(size_px: int) -> bytes:
+    """Make a noisy PNG, which compresses about as badly as a real DALL-E image."""
+    image = Image.frombytes('RGB', (size_px, size_px), os.urandom(size_px * size_px * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+class MockOpenAIServer:
+    """aiohttp application emulating /v1/chat/completions and /v1/images/generations."""
+
+    def __init__(
+        self,
+        first_token_latency: float = 0.5,
+        token_delay: float = 0.005,
+        chunk_chars: int = 4,
+        image_latency: float = 2.0,
+        image_px: int = 1024,
+        error_rate: float = 0.0,
+        error_status: int = 429,
+        fixtures_dir: Path = FIXTURES_DIR,
+    ):
+        self.first_token_latency = first_token_latency
+        self.token_delay = token_delay
+        self.chunk_chars = chunk_chars
+        self.image_latency = image_latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.fixtures = load_fixtures(fixtures_dir)
+        self.json_fixtures = load_fixtures(fixtures_dir, ".json")
+        self.image_bytes = make_png(image_px)
+        self.images: Dict[str, bytes] = {}
+        self.prompt_prefixes = set()
+        self.requests = {'chat': 0, 'images': 0, 'downloads': 0, 'errors': 0}
+        self.port: Optional[int] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def build_app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post('/v1/chat/completions', self.chat_completions)
+        app.router.add_post('/v1/images/generations', self.image_generations)
+        app.router.add_get('/files/{image_id}.png', self.download_image)
+        return app
+
+    def _maybe_error(self) -> Optional[web.Response]:
+        if random.random() >= self.error_rate:
+            return None
+        self.requests['errors'] += 1
+        body = {'error': {'message': 'Mock error', 'type': 'mock_error', 'code': None}}
+        return web.json_response(body, status=self.error_status, headers={'retry-after': '0.1'})
+
+    def _completion_text(self, body: Dict) -> str:
+        """Pick the next fixture in rotation and make its image prompts unique to the request.
+
+        Unique prompts keep the image store from short-circuiting repeated runs,
+        so every benchmarked intent pays for its images like a new concept would.
+        A json_schema request other than the explanation itself (e.g. a field
+        repair) gets every property of its schema filled with placeholder text.
+        """
+        request_key = hashlib.sha256(json.dumps(body.get('messages', []), sort_keys=True).encode()).hexdigest()
+        response_format = body.get('response_format') or {}
+        fixtures = self.fixtures
+        if response_format.get('type') == 'json_schema':
+            json_schema = response_format['json_schema']
+            if json_schema.get('name') != 'explanation':
+                properties = json_schema['schema'].get('properties', {})
+                return json.dumps({key: f"Mock {key} ({request_key[:8]})" for key in properties})
+            fixtures = self.json_fixtures
+        elif response_format.get('type') == 'json_object':
+            fixtures = self.json_fixtures
+        text = fixtures[self.requests['chat'] % len(fixtures)]
+        return _IMAGE_DESCRIPTION_RE.sub(lambda m: f"{m.group(1)}{m.group(2)} (variation {request_key[:8]}){m.group(3)}", text)
+
+    def _usage(self, body: Dict, text: str) -> Dict:
+        """Approximate token counts, reporting a repeated first message as a prompt-cache hit."""
+        messages = body.get('messages', [])
+        prompt_tokens = len(json.dumps(messages)) // 4
+        completion_tokens = len(text) // 4
+        cached_tokens = 0
+        if messages:
+            prefix = json.dumps(messages[0], sort_keys=True)
+            if prefix in self.prompt_prefixes:
+                cached_tokens = len(prefix) // 4
+            self.prompt_prefixes.add(prefix)
+        return {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+            'prompt_tokens_details': {'cached_tokens': cached_tokens},
+        }
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        self.requests['chat'] += 1
+        body = await request.json()
+        await asyncio.sleep(self.first_token_latency)
+        error = self._maybe_error()
+        if error is not None:
+            return error
+
+        text = self._completion_text(body)
+        base = {'id': 'chatcmpl-mock', 'created': int(time.time()), 'model': body.get('model', 'mock')}
+        chunks = [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)]
+
+        if not body.get('stream'):
+            await asyncio.sleep(self.token_delay * len(chunks))
+            return web.json_response({
+                **base,
+                'object': 'chat.completion',
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}],
+                'usage': self._usage(body, text),
+            })
+
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+        for chunk in chunks:
+            event = {
+                **base,
+                'object': 'chat.completion.chunk',
+                'choices': [{'index': 0, 'delta': {'content': chunk}, 'finish_reason': None}],
+            }
+            await response.write(f"data: {json.dumps(event)}\n\n".encode())
+            await asyncio.sleep(self.token_delay)
+        event = {**base, 'object': 'chat.completion.chunk', 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]}
+        await response.write(f"data: {json.dumps(event)}\n\n".encode())
+        if body.get('stream_options', {}).get('include_usage'):
+            event = {**base, 'object': 'chat.completion.chunk', 'choices': [], 'usage': self._usage(body, text)}
+            await response.write(f"data: {json.dumps(event)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    async def image_generations(self, request: web.Request) -> web.Response:
+        self.requests['images'] += 1
+        body = await request.json()
+        await asyncio.sleep(self.image_latency)
+        error = self._maybe_error()
+        if error is not None:
+            return error
+
+        if body.get('response_format') == 'b64_json':
+            data = {'b64_json': base64.b64encode(self.image_bytes).decode('ascii')}
+        else:
+            image_id = hashlib.sha256(body['prompt'].encode()).hexdigest()[:16]
+            self.images[image_id] = self.image_bytes
+            data = {'url': f"http://127.0.0.1:{self.port}/files/{image_id}.png"}
+        return web.json_response({'created': int(time.time()), 'data': [{**data, 'revised_prompt': body['prompt']}]})
+
+    async def download_image(self, request: web.Request) -> web.Response:
+        self.requests['downloads'] += 1
+        image = self.images.get(request.match_info['image_id'])
+        if image is None:
+            raise web.HTTPNotFound()
+        return web.Response(body=image, content_type='image/png')
+
+    def start_in_thread(self, port: int = 0) -> str:
+        """Start the server on a background thread and return its /v1 base URL."""
+        started = threading.Event()
+
+        async def serve() -> None:
+            self._runner = web.AppRunner(self.build_app(), access_log=None)
+            await self._runner.setup()
+            site = web.TCPSite(self._runner, '127.0.0.1', port)
+            await site.start()
+            self.port = site._server.sockets[0].getsockname()[1]
+            started.set()
+
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="mock-openai", daemon=True).start()
+        asyncio.run_coroutine_threadsafe(serve(), self._loop)
+        started.wait(timeout=10)
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    def stop(self) -> None:
+        if self._loop is None:
+            return
+        if self._runner is not None:
+            asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result(timeout=10)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+def add_server_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--first-token-latency', type=float, default=0.5, help="Seconds before the first chat token")
+    parser.add_argument('--token-delay', type=float, default=0.005, help="Seconds between streamed chunks")
+    parser.add_argument('--image-latency', type=float, default=2.0, help="Seconds per image generation")
+    parser.add_argument('--image-px', type=int, default=1024, help="Width/height of returned images")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument('--error-status', type=int, default=429, help="HTTP status of injected failures")
+
+def server_from_args(args: argparse.Namespace) -> MockOpenAIServer:
+    return MockOpenAIServer(
+        first_token_latency=args.first_token_latency,
+        token_delay=args.token_delay,
+        image_latency=args.image_latency,
+        image_px=args.image_px,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local mock of the OpenAI chat and image endpoints.")
+    parser.add_argument('--port', type=int, default=8765)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = server_from_args(args)
+    server.port = args.port
+    print(f"Mock OpenAI server on http://127.0.0.1:{args.port}/v1")
+    web.run_app(server.build_app(), host='127.0.0.1', port=args.port, print=None)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
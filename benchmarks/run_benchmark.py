@@ -0,0 +1,167 @@
+"""Offline end-to-end benchmark against the local mock OpenAI server.
+
+Reports p50/p95/p99 per pipeline stage (completion, parse, images, docx) and
+throughput with N concurrent intents, without paying for real API calls:
+
+    python benchmarks/run_benchmark.py --runs 10 --concurrency 4 --image-latency 2
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+
+project_root = Path(__file__).resolve().parent.parent
+for path in (project_root, project_root / "src"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+from benchmarks.mock_openai_server import add_server_arguments, server_from_args
+
+logger = logging.getLogger(__name__)
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+def summarize(samples: Dict[str, List[float]]) -> Dict[str, Dict]:
+    return {
+        stage: {
+            'count': len(values),
+            'p50': percentile(values, 50),
+            'p95': percentile(values, 95),
+            'p99': percentile(values, 99),
+            'mean': sum(values) / len(values) if values else float('nan'),
+        }
+        for stage, values in samples.items()
+    }
+
+def prepare_workdir() -> Path:
+    """Run inside a scratch directory so benchmark artifacts never touch the repo's outputs."""
+    workdir = Path(tempfile.mkdtemp(prefix="simplifygpt_bench_"))
+    for name in ("config", "prompts"):
+        (workdir / name).symlink_to(project_root / name, target_is_directory=True)
+    os.chdir(workdir)
+    return workdir
+
+def run_staged(intents: List[str]) -> Dict[str, List[float]]:
+    """Time each stage separately, one intent at a time."""
+    from utils import build_document, get_run_index, parse_explanation, run_async
+    from utils.image_helpers import generate_images_async, make_run_id
+    from utils.openai_helpers import get_completion_async
+
+    samples = {'completion': [], 'parse': [], 'images': [], 'docx': []}
+    failures = {'parse': 0}
+    for intent in intents:
+        start = time.perf_counter()
+        yaml_response = run_async(get_completion_async(intent))
+        samples['completion'].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        parsed = parse_explanation(yaml_response, intent)
+        samples['parse'].append(time.perf_counter() - start)
+        if not isinstance(parsed, dict):
+            failures['parse'] += 1
+            continue
+
+        run_id = make_run_id(intent)
+        get_run_index().start_run(run_id, intent)
+        start = time.perf_counter()
+        run_async(generate_images_async(parsed, run_id))
+        samples['images'].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        build_document(parsed, run_id)
+        samples['docx'].append(time.perf_counter() - start)
+
+    if failures['parse']:
+        logger.warning(f"{failures['parse']} completions failed to parse")
+    return samples
+
+def run_concurrent(intents: List[str], concurrency: int) -> Dict:
+    """Run full pipelines concurrently and measure end-to-end latency and throughput."""
+    from utils import generate_explanation, get_document
+
+    def one(intent: str) -> float:
+        start = time.perf_counter()
+        result = generate_explanation(intent)
+        if isinstance(result['parsed_response'], dict):
+            get_document(result['parsed_response'], result['run_id'])
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(one, intents))
+    elapsed = time.perf_counter() - start
+    return {'latencies': latencies, 'elapsed': elapsed, 'throughput': len(intents) / elapsed}
+
+def print_report(summary: Dict[str, Dict], concurrent: Dict, concurrency: int, server) -> None:
+    print(f"\n{'stage':<14}{'n':>5}{'p50':>10}{'p95':>10}{'p99':>10}{'mean':>10}")
+    for stage, stats in summary.items():
+        print(f"{stage:<14}{stats['count']:>5}{stats['p50']:>10.3f}{stats['p95']:>10.3f}"
+              f"{stats['p99']:>10.3f}{stats['mean']:>10.3f}")
+    print(f"\nConcurrent pipelines ({concurrency} at a time): "
+          f"{concurrent['throughput']:.2f} intents/s over {concurrent['elapsed']:.2f}s")
+    print(f"Mock server requests: {server.requests}")
+
+    from utils import metrics
+    prompt_tokens = metrics.counter_value('simplifygpt_tokens_total', kind='prompt')
+    cached_tokens = metrics.counter_value('simplifygpt_tokens_total', kind='cached_prompt')
+    if prompt_tokens:
+        print(f"Prompt tokens: {prompt_tokens:.0f} ({cached_tokens / prompt_tokens:.0%} served from the prompt cache)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the generation pipeline against a local mock OpenAI server.")
+    parser.add_argument('--runs', type=int, default=10, help="Intents per phase")
+    parser.add_argument('--concurrency', type=int, default=4, help="Concurrent intents in the throughput phase")
+    parser.add_argument('--json', help="Also write the results to this JSON file")
+    parser.add_argument('--chat-rpm', type=float, help="Override rate_limits.chat.requests_per_minute")
+    parser.add_argument('--images-rpm', type=float, help="Override rate_limits.images.requests_per_minute")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+    json_path = Path(args.json).resolve() if args.json else None
+
+    server = server_from_args(args)
+    os.environ['OPENAI_BASE_URL'] = server.start_in_thread()
+    os.environ.setdefault('OPENAI_API_KEY', 'mock-key')
+    workdir = prepare_workdir()
+
+    from config.config_manager import ConfigManager
+    config = ConfigManager()
+    # Measure the uncached path: every intent is a new concept
+    config.set('cache.completions.enabled', False)
+    if args.chat_rpm:
+        config.set('rate_limits.chat.requests_per_minute', args.chat_rpm)
+    if args.images_rpm:
+        config.set('rate_limits.images.requests_per_minute', args.images_rpm)
+
+    run_tag = int(time.time())
+    staged = run_staged([f"benchmark concept {run_tag} {i}" for i in range(args.runs)])
+    concurrent = run_concurrent([f"concurrent concept {run_tag} {i}" for i in range(args.runs)], args.concurrency)
+    staged['pipeline'] = concurrent['latencies']
+
+    summary = summarize(staged)
+    print_report(summary, concurrent, args.concurrency, server)
+    if json_path:
+        json_path.write_text(json.dumps({
+            'stages': summary,
+            'throughput': concurrent['throughput'],
+            'concurrency': args.concurrency,
+            'server': vars(args),
+        }, indent=2))
+    server.stop()
+    logger.info(f"Benchmark artifacts left in {workdir}")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
@@ -0,0 +1,90 @@
+"""Cold-start import benchmark for the app and CLI entry points.
+
+Imports each entry point in a fresh interpreter, reports the median import
+time against a budget and which heavy dependencies were loaded eagerly:
+
+    python benchmarks/startup_benchmark.py --repeat 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+project_root = Path(__file__).resolve().parent.parent
+
+# Import-time budgets in milliseconds; the first paint only needs config, logging and metrics
+DEFAULT_BUDGETS = {
+    'utils': 150,
+    'main': 150,
+    'app': 1500,
+}
+
+HEAVY_MODULES = ('openai', 'httpx', 'pydantic', 'docx', 'PIL', 'aiohttp', 'yaml')
+
+_PROBE = """
+import importlib, json, sys, time
+start = time.perf_counter()
+module = importlib.import_module({module!r})
+{touch}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+# Attributes an entry point touches before its first output
+_FIRST_USE = {
+    'utils': "module.setup_logging, module.start_metrics, module.generate_explanation",
+}
+
+def measure(module: str, repeat: int) -> Dict:
+    """Import a module in `repeat` fresh interpreters and collect timings."""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([str(project_root / "src"), str(project_root), env.get('PYTHONPATH', '')])
+    env.setdefault('OPENAI_API_KEY', 'startup-benchmark')
+    code = _PROBE.format(module=module, touch=_FIRST_USE.get(module, ''), heavy=HEAVY_MODULES)
+
+    samples: List[float] = []
+    loaded: List[str] = []
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-c", code], cwd=project_root, env=env, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            return {'error': result.stderr.strip().splitlines()[-1]}
+        probe = json.loads(result.stdout.strip().splitlines()[-1])
+        samples.append(probe['seconds'] * 1000)
+        loaded = probe['loaded']
+    return {'median_ms': statistics.median(samples), 'max_ms': max(samples), 'loaded': loaded}
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start import time of the entry points.")
+    parser.add_argument('--repeat', type=int, default=5, help="Fresh interpreters per entry point")
+    parser.add_argument('--modules', nargs='+', default=list(DEFAULT_BUDGETS), help="Modules to import")
+    parser.add_argument('--json', help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = {}
+    over_budget = False
+    print(f"{'module':<10}{'median ms':>12}{'max ms':>10}{'budget':>10}  eager heavy imports")
+    for module in args.modules:
+        result = measure(module, args.repeat)
+        result['budget_ms'] = DEFAULT_BUDGETS.get(module)
+        results[module] = result
+        if 'error' in result:
+            print(f"{module:<10}{'skipped':>12}  ({result['error']})")
+            continue
+        within = result['budget_ms'] is None or result['median_ms'] <= result['budget_ms']
+        over_budget |= not within
+        budget = f"{result['budget_ms']}" if result['budget_ms'] is not None else '-'
+        print(f"{module:<10}{result['median_ms']:>12.1f}{result['max_ms']:>10.1f}{budget:>10}"
+              f"{'' if within else ' OVER'}  {', '.join(result['loaded']) or 'none'}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+    sys.exit(1 if over_budget else 0)
+
+if __name__ == "__main__":
+    main()
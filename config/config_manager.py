@@ -32,4 +32,12 @@ class ConfigManager:
         value = self._config
         for key in keys:
             value = value[key]
-        return value 
\ No newline at end of file
+        return value
+
+    def set(self, key_path, value):
+        """Override a config value for this process (e.g. for benchmarks)."""
+        keys = key_path.split('.')
+        target = self._config
+        for key in keys[:-1]:
+            target = target.setdefault(key, {})
+        target[keys[-1]] = value
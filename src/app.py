@@ -1,6 +1,7 @@
 import streamlit as st
 import time
 import logging
+import queue
 import sys
 from pathlib import Path
 
@@ -11,38 +12,117 @@ if str(project_root) not in sys.path:
     sys.path.insert(0, str(project_root))
 
 # Import local modules
-from utils import setup_logging, get_completion, parse_yaml_response, display_explanation
+from utils import setup_logging, start_explanation, start_metrics, preload_pipeline, get_job_queue, normalize_intent
+from utils import find_similar_run, get_run_result
+from config.config_manager import ConfigManager
 from rendition.page_config import render_page_config
-from rendition.content import render_input_section, render_explanation
+from rendition.content import render_input_section, render_explanation, render_explanation_progressively
+from rendition.session import recall_run, remember_run
 from rendition.document import render_document, render_images_grid
 
+def generate_with_worker(user_intent: str, status, refresh: bool = False) -> dict:
+    """Queue the explanation for the worker processes and poll until it is ready.
+
+    The job id is kept in the session, so a rerun or reconnect picks up the same
+    job instead of starting another one.
+    """
+    job_queue = get_job_queue()
+    jobs = st.session_state.setdefault('jobs', {})
+    key = normalize_intent(user_intent)
+    if key not in jobs:
+        jobs[key] = job_queue.submit('explanation', {'user_intent': user_intent, 'refresh': refresh})
+    
+    job = job_queue.get(jobs[key])
+    while job['status'] not in ('done', 'failed'):
+        status.info(f"Generating explanation ({job['status']})...")
+        time.sleep(ConfigManager().get('jobs.poll_interval'))
+        job = job_queue.get(jobs[key])
+    
+    del jobs[key]
+    if job['status'] == 'failed':
+        raise RuntimeError(f"Job {job['job_id']} failed: {job['error']}")
+    result = job['result']
+    if isinstance(result['parsed_response'], dict):
+        render_explanation(result['parsed_response'], result['output_folder'], result['run_id'])
+    return result
+
+def offer_similar_run(user_intent: str):
+    """In dedup "offer" mode, offer the past run of a near-duplicate intent instead of a new generation.
+
+    Returns that run's result if the user takes it, or None to generate; the
+    script stops here while the user decides.
+    """
+    if ConfigManager().get('dedup.mode') != 'offer':
+        return None
+    key = normalize_intent(user_intent)
+    declined = st.session_state.setdefault('declined_matches', set())
+    if key in declined:
+        return None
+    match = find_similar_run(user_intent)
+    if match is None:
+        return None
+    
+    st.info(f"We already explained **{match['user_intent']}** ({match['score']:.0%} similar).")
+    show_column, generate_column = st.columns(2)
+    if show_column.button("Show that explanation", key=f"similar_show_{match['run_id']}"):
+        result = get_run_result(match['run_id'], user_intent)
+        if result is not None:
+            return result
+    elif not generate_column.button("Generate a new one", key=f"similar_new_{match['run_id']}"):
+        st.stop()
+    declined.add(key)
+    return None
+
 def main():
     render_page_config()
-    setup_logging()
+    setup_logging('app')
+    start_metrics()
+    preload_pipeline()
     
     user_intent = render_input_section()
     
     if user_intent:
-        with st.spinner("Generating explanation..."):
-            try:
-                start_time = time.time()
-                yaml_response = get_completion(user_intent)
-                parsed_response = parse_yaml_response(yaml_response)
-                
-                if isinstance(parsed_response, dict):
-                    output_folder = display_explanation(parsed_response, user_intent)
-                    logger.info(f"Output folder: {output_folder}")
-                    
-                    st.success(f"Generated explanation in {time.time() - start_time:.2f} seconds!")
-                    render_explanation(parsed_response, output_folder)
+        # Reruns (downloads, step fixes, any widget) re-render the finished run; only an
+        # explicit regenerate starts a fresh one
+        memo = recall_run(user_intent)
+        refresh = memo is not None and st.button(
+            "🔄 Regenerate", key="regenerate_run", help="Generate a fresh explanation and new images instead of the ones shown"
+        )
+        if memo is not None and not refresh:
+            render_explanation(memo['parsed_response'], memo['output_folder'], memo['run_id'])
+            return
+        
+        similar = None if refresh else offer_similar_run(user_intent)
+        if similar is not None:
+            remember_run(user_intent, similar)
+            render_explanation(similar['parsed_response'], similar['output_folder'], similar['run_id'])
+            return
+        
+        status = st.empty()
+        status.info("Generating explanation...")
+        try:
+            start_time = time.time()
+            if ConfigManager().get('jobs.mode') == 'queue':
+                result = generate_with_worker(user_intent, status, refresh)
+            else:
+                # Generate in the background and render each part as it arrives
+                events = queue.Queue()
+                result = render_explanation_progressively(events, start_explanation(user_intent, events.put, refresh))
+            parsed_response = result['parsed_response']
+            
+            if isinstance(parsed_response, dict):
+                output_folder = result['output_folder']
+                logger.info(f"Output folder: {output_folder}")
+                remember_run(user_intent, result)
                 
-                else:
-                    st.error("Failed to generate explanation. Please try again.")
-                    logger.error(f"Failed to parse YAML response: {yaml_response}")
+                status.success(f"Generated explanation in {time.time() - start_time:.2f} seconds!")
             
-            except Exception as e:
-                st.error("An error occurred while generating the explanation.")
-                logger.error(f"Error in Streamlit app: {e}", exc_info=True)
+            else:
+                status.error("Failed to generate explanation. Please try again.")
+        
+        except Exception as e:
+            status.error("An error occurred while generating the explanation.")
+            logger.error(f"Error in Streamlit app: {e}", exc_info=True)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,129 @@
+from utils import setup_logging, start_metrics, generate_explanation, get_document, PRIORITY_BACKGROUND
+from utils.rate_limiter import request_priority
+from config.config_manager import ConfigManager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Set
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+def read_intents(path: str) -> List[str]:
+    """Read one intent per line, skipping blank lines, comments and repeated lines.
+
+    Only identical lines are duplicates: "C++ basics" and "C# basics" are different concepts.
+    """
+    intents = []
+    seen = set()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            intent = line.strip()
+            if not intent or intent.startswith('#') or intent in seen:
+                continue
+            seen.add(intent)
+            intents.append(intent)
+    return intents
+
+def load_completed(manifest_path: str) -> Set[str]:
+    """Return the intents, as read from the intents file, that already finished successfully in the manifest."""
+    completed = set()
+    if not os.path.exists(manifest_path):
+        return completed
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash can leave a truncated last line; that intent is simply redone
+                continue
+            if record.get('status') == 'ok':
+                completed.add(record['intent'])
+    return completed
+
+class Manifest:
+    """Append-only JSONL results manifest that doubles as the resume checkpoint."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+    def append(self, record: Dict) -> None:
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+def process_intent(user_intent: str) -> Dict:
+    """Run one intent through completion, parsing, images and document generation."""
+    start_time = time.time()
+    record = {'intent': user_intent}
+    try:
+        result = generate_explanation(user_intent)
+        record['run_id'] = result['run_id']
+        if isinstance(result['parsed_response'], dict):
+            record['output_folder'] = result['output_folder']
+            record['document'] = str(get_document(result['parsed_response'], result['run_id']))
+            record['status'] = 'ok'
+        else:
+            record['status'] = 'parse_error'
+    except Exception as e:
+        logger.error(f"Batch item '{user_intent}' failed: {e}", exc_info=True)
+        record['status'] = 'error'
+        record['error'] = str(e)
+    record['duration'] = round(time.time() - start_time, 2)
+    record['finished_at'] = datetime.now().isoformat(timespec='seconds')
+    return record
+
+def _init_worker() -> None:
+    # Batch work yields to interactive sessions in the shared rate limiters
+    request_priority.set(PRIORITY_BACKGROUND)
+
+def run_batch(intents: List[str], manifest_path: str, concurrency: int) -> Dict:
+    """Process intents with bounded concurrency, skipping those already completed in the manifest."""
+    completed = load_completed(manifest_path)
+    pending = [intent for intent in intents if intent not in completed]
+    logger.info(f"Batch: {len(intents)} intents, {len(intents) - len(pending)} already done, {len(pending)} to run")
+    
+    manifest = Manifest(manifest_path)
+    counts = {'ok': 0, 'parse_error': 0, 'error': 0, 'skipped': len(intents) - len(pending)}
+    start_time = time.time()
+    
+    with ThreadPoolExecutor(max_workers=concurrency, initializer=_init_worker) as executor:
+        futures = {executor.submit(process_intent, intent): intent for intent in pending}
+        for done, future in enumerate(as_completed(futures), start=1):
+            record = future.result()
+            manifest.append(record)
+            counts[record['status']] += 1
+            logger.info(f"[{done}/{len(pending)}] {record['status']}: {record['intent']} ({record['duration']:.2f}s)")
+    
+    logger.info(f"Batch finished in {time.time() - start_time:.2f}s: {counts}")
+    return counts
+
+def main():
+    config = ConfigManager()
+    parser = argparse.ArgumentParser(description="Pre-generate explanations for a file of intents.")
+    parser.add_argument('intents_file', help="Text file with one intent per line")
+    parser.add_argument('--concurrency', type=int, default=config.get('batch.concurrency'),
+                        help="Number of intents generated in parallel")
+    parser.add_argument('--manifest', default=config.get('batch.manifest_path'),
+                        help="JSONL results manifest; finished intents in it are skipped on resume")
+    args = parser.parse_args()
+    
+    intents = read_intents(args.intents_file)
+    counts = run_batch(intents, args.manifest, args.concurrency)
+    print(f"\nDone: {counts['ok']} ok, {counts['parse_error'] + counts['error']} failed, "
+          f"{counts['skipped']} skipped. Manifest: {args.manifest}")
+
+if __name__ == "__main__":
+    setup_logging('batch')
+    start_metrics()
+    main()
@@ -1,42 +1,95 @@
-from utils import setup_logging, get_completion, parse_yaml_response, display_explanation
+from utils import setup_logging, start_metrics, preload_pipeline
+from config.config_manager import ConfigManager
 import logging
 import time
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+def run_with_worker(user_intent: str) -> None:
+    """Queue the explanation for the worker processes and wait for its result."""
+    from utils import get_job_queue
+    
+    job_queue = get_job_queue()
+    job_id = job_queue.submit('explanation', {'user_intent': user_intent})
+    print(f"Queued job {job_id}; waiting for a worker...")
+    job = job_queue.wait(job_id, poll_interval=ConfigManager().get('jobs.poll_interval'))
+    if job['status'] == 'failed':
+        logger.error(f"Job {job_id} failed: {job['error']}")
+        return
+    
+    result = job['result']
+    if isinstance(result['parsed_response'], dict):
+        logger.info(f"Output saved to: {result['output_folder']}")
+        logger.info(f"Document: {result.get('document')}")
+    else:
+        print(result['parsed_response'])
+        logger.error("Failed to parse response")
+
+def reuse_similar_run(user_intent: str) -> bool:
+    """Reuse the past run of a near-duplicate intent, asking first in dedup "offer" mode."""
+    from utils import find_similar_run, get_run_result, get_document
+    
+    match = find_similar_run(user_intent)
+    if match is None:
+        return False
+    if ConfigManager().get('dedup.mode') == 'offer':
+        answer = input(f"\nWe already explained '{match['user_intent']}' ({match['score']:.0%} similar). Use it? [Y/n] ")
+        if answer.strip().lower() not in ('', 'y', 'yes'):
+            return False
+    
+    result = get_run_result(match['run_id'], user_intent)
+    if result is None:
+        return False
+    logger.info(f"Reused run: {result['run_id']}")
+    logger.info(f"Document: {get_document(result['parsed_response'], result['run_id'])}")
+    return True
+
 def main():
     start_time = time.time()
     logger.info("Starting application")
     
     try:
+        # Load the generation pipeline while waiting for input
+        preload_pipeline()
+
         # Ask for user input
         print("\nWhat concept would you like to understand better?")
         user_intent = input("> ")
         input_time = time.time()
         logger.info(f"Received user input in {input_time - start_time:.2f}s: {user_intent}")
         
+        if reuse_similar_run(user_intent):
+            logger.info(f"Total Time: {time.time() - start_time:.2f}s")
+            return
+        
         print("\nGenerating explanation...\n")
+        if ConfigManager().get('jobs.mode') == 'queue':
+            run_with_worker(user_intent)
+            logger.info(f"Total Time: {time.time() - start_time:.2f}s")
+            return
         
-        # Get raw response
-        yaml_response = get_completion(user_intent)
-        completion_time = time.time()
-        logger.info(f"Generated OpenAI response in {completion_time - input_time:.2f}s")
+        from utils import generate_completion_and_images, fill_missing_images, display_explanation, get_document, get_run_index
         
-        # Parse YAML response
-        parsed_response = parse_yaml_response(yaml_response)
-        parsing_time = time.time()
-        logger.info(f"Parsed YAML in {parsing_time - completion_time:.2f}s")
+        # Get the parsed and validated response, generating step images while it streams
+        yaml_response, parsed_response, run_id = generate_completion_and_images(user_intent)
+        completion_time = time.time()
+        logger.info(f"Generated and parsed OpenAI response and images in {completion_time - input_time:.2f}s")
         
         # Display results
         if isinstance(parsed_response, dict):
-            output_folder = display_explanation(parsed_response, user_intent)
+            fill_missing_images(parsed_response, run_id)
+            output_folder = display_explanation(parsed_response, user_intent, run_id)
+            doc_path = get_document(parsed_response, run_id)
+            get_run_index().update_run(run_id, status='ok', title=parsed_response['title'], explanation=parsed_response)
             display_time = time.time()
-            logger.info(f"Generated document and images in {display_time - parsing_time:.2f}s")
+            logger.info(f"Generated document in {display_time - completion_time:.2f}s")
             logger.info(f"Output saved to: {output_folder}")
+            logger.info(f"Document: {doc_path}")
         else:
             print(parsed_response)
-            logger.error("Failed to parse response as YAML")
+            logger.error("Failed to parse response")
+            get_run_index().update_run(run_id, status='parse_error', error='Response could not be parsed')
         
         # Log total execution time
         end_time = time.time()
@@ -44,9 +97,8 @@ def main():
         
         logger.info("\nExecution Summary:")
         logger.info(f"├── Input Time: {input_time - start_time:.2f}s")
-        logger.info(f"├── OpenAI Generation: {completion_time - input_time:.2f}s")
-        logger.info(f"├── YAML Parsing: {parsing_time - completion_time:.2f}s")
-        logger.info(f"├── Document & Images: {display_time - parsing_time:.2f}s")
+        logger.info(f"├── OpenAI Generation, Parsing & Images: {completion_time - input_time:.2f}s")
+        logger.info(f"├── Document: {display_time - completion_time:.2f}s")
         logger.info(f"└── Total Time: {total_time:.2f}s")
         
     except Exception as e:
@@ -56,5 +108,6 @@ def main():
         raise
 
 if __name__ == "__main__":
-    setup_logging()
+    setup_logging('main')
+    start_metrics()
     main() 
\ No newline at end of file
@@ -1,7 +1,12 @@
 import streamlit as st
-from pathlib import Path
-from PIL import Image
 import logging
+import queue
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Dict, Optional
+from config.config_manager import ConfigManager
+from utils.run_index import get_run_index
+from utils.image_variants import get_image_variant
 
 logger = logging.getLogger(__name__)
 
@@ -26,7 +31,7 @@ def render_input_section():
         key="concept_input"
     )
 
-def render_explanation(parsed_response: dict, output_folder: str):
+def render_explanation(parsed_response: dict, output_folder: str, run_id: str):
     """Render the explanation content."""
     # Create an anchor div at the top of the explanation
     st.markdown('<div id="explanation-start"></div>', unsafe_allow_html=True)
@@ -34,12 +39,68 @@ def render_explanation(parsed_response: dict, output_folder: str):
     st.title(parsed_response['title'])
     st.write(parsed_response['introduction'])
     
-    images_folder = output_folder.replace("output", "images")
-    logger.info(f"Looking for images in: {images_folder}")
+    step_images = get_run_index().step_images(run_id)
+    logger.info(f"Resolved {len(step_images)} images for run: {run_id}")
     
-    _render_steps(parsed_response['steps'], images_folder)
+    _render_steps(parsed_response['steps'], step_images)
+    _render_explanation_end(parsed_response, run_id)
+
+def render_explanation_progressively(events: queue.Queue, future: Future) -> Dict:
+    """Render the explanation while it is generated, from the pipeline's progress events.
+
+    The title, introduction and each step appear as soon as they are parsed from
+    the stream, and each step's image placeholder fills in when its image is
+    stored. Once the pipeline finishes, everything is reconciled with the final,
+    validated explanation. Returns the pipeline result.
+    """
+    st.markdown('<div id="explanation-start"></div>', unsafe_allow_html=True)
+    title_slot = st.empty()
+    introduction_slot = st.empty()
+    steps_area = st.container()
+    step_slots: Dict[int, Dict] = {}
+    steps: Dict[int, dict] = {}
+    images: Dict[int, Optional[Path]] = {}
+
+    while not (future.done() and events.empty()):
+        try:
+            event = events.get(timeout=0.1)
+        except queue.Empty:
+            continue
+
+        if event['type'] == 'field' and event['name'] == 'title':
+            title_slot.title(event['value'])
+        elif event['type'] == 'field' and event['name'] == 'introduction':
+            introduction_slot.write(event['value'])
+        elif event['type'] == 'step':
+            step = event['step']
+            steps[step['step_number']] = step
+            if step['step_number'] not in step_slots:
+                step_slots[step['step_number']] = _add_step_slots(steps_area)
+            pending = step['step_number'] not in images
+            _fill_step(step_slots[step['step_number']], step, images.get(step['step_number']), pending)
+        elif event['type'] == 'image':
+            images[event['step_number']] = event['path']
+            if event['step_number'] in step_slots:
+                _fill_image(step_slots[event['step_number']], steps[event['step_number']], event['path'])
+
+    result = future.result()
+    parsed_response = result['parsed_response']
+    if not isinstance(parsed_response, dict):
+        return result
+
+    title_slot.title(parsed_response['title'])
+    introduction_slot.write(parsed_response['introduction'])
+    step_images = get_run_index().step_images(result['run_id'])
+    for step in parsed_response['steps']:
+        if step['step_number'] not in step_slots:
+            step_slots[step['step_number']] = _add_step_slots(steps_area)
+        _fill_step(step_slots[step['step_number']], step, step_images.get(step['step_number']))
+    _render_explanation_end(parsed_response, result['run_id'])
+    return result
+
+def _render_explanation_end(parsed_response: dict, run_id: str):
+    """Render the conclusion, scroll to the explanation and offer the document."""
     _render_conclusion(parsed_response['conclusion'])
-    _render_download_button(output_folder)
 
     # Add JavaScript to scroll to the anchor
     js = """
@@ -60,37 +121,116 @@ def render_explanation(parsed_response: dict, output_folder: str):
     """
     st.markdown(js, unsafe_allow_html=True)
 
-def _render_steps(steps: list, images_folder: str):
+    # Rendered last: the document may still be building in the background
+    _render_download_button(parsed_response, run_id)
+    _render_step_actions(parsed_response, run_id)
+
+def _render_steps(steps: list, step_images: dict):
     """Render the explanation steps with images."""
     for step in steps:
-        st.header(f"{step['heading']}")
-        st.write(step['text'])
-        
-        image_path = Path(images_folder) / f"step_{step['step_number']}.png"
-        if image_path.exists():
-            try:
-                image = Image.open(image_path)
-                st.write(step['image_description'])
-                st.image(image, use_container_width=True)
-            except Exception as e:
-                logger.error(f"Error displaying image {image_path}: {e}")
-                st.error(f"Failed to load image for Step {step['step_number']}")
-        
-        if 'transition' in step:
-            st.write(f"{step['transition']}")
+        _fill_step(_add_step_slots(st.container()), step, step_images.get(step['step_number']))
+
+def _add_step_slots(container) -> Dict:
+    """Reserve the placeholders of one step, in display order."""
+    with container:
+        return {name: st.empty() for name in ('heading', 'text', 'image_description', 'image', 'transition')}
+
+def _fill_step(slots: Dict, step: dict, image_path: Optional[Path], pending: bool = False):
+    """Fill a step's placeholders; with pending, a missing image shows as in progress."""
+    slots['heading'].header(f"{step['heading']}")
+    slots['text'].write(step['text'])
+    if pending:
+        slots['image_description'].write(step['image_description'])
+        slots['image'].info("Generating image...")
+    else:
+        _fill_image(slots, step, image_path)
+    if step.get('transition'):
+        slots['transition'].write(f"{step['transition']}")
+
+def _fill_image(slots: Dict, step: dict, image_path: Optional[Path]):
+    """Show a step's image with its description, or clear both if there is no image."""
+    if image_path is None or not image_path.exists():
+        slots['image_description'].empty()
+        slots['image'].empty()
+        return
+    try:
+        slots['image_description'].write(step['image_description'])
+        variant = get_image_variant(image_path, ConfigManager().get('image_variants.layout.step'))
+        slots['image'].image(variant, use_container_width=True)
+    except Exception as e:
+        logger.error(f"Error displaying image {image_path}: {e}")
+        slots['image'].error(f"Failed to load image for Step {step['step_number']}")
 
 def _render_conclusion(conclusion: str):
     """Render the conclusion section."""
     st.header("Conclusion")
     st.write(conclusion)
 
-def _render_download_button(output_folder: str):
+def _regenerate(kind: str, **payload):
+    """Run a regeneration inline, or on the worker processes when jobs.mode is "queue"."""
+    from utils.regenerate_helpers import regenerate_images, regenerate_step_text
+
+    if ConfigManager().get('jobs.mode') == 'queue':
+        from utils.job_queue import get_job_queue
+        job_queue = get_job_queue()
+        job = job_queue.wait(job_queue.submit(kind, payload), poll_interval=ConfigManager().get('jobs.poll_interval'))
+        if job['status'] == 'failed':
+            raise RuntimeError(job['error'])
+    elif kind == 'regenerate_step':
+        regenerate_step_text(**payload)
+    else:
+        regenerate_images(**payload)
+
+def _render_step_actions(parsed_response: dict, run_id: str):
+    """Offer to regenerate missing or failed images, or one step, without rerunning the whole pipeline."""
+    from rendition.session import refresh_run
+    from utils.regenerate_helpers import incomplete_steps
+
+    run = get_run_index().get_run(run_id)
+    if run is None:
+        return
+    missing = incomplete_steps(run)
+    deferred = any(step['status'] == 'deferred' for step in run['steps'])
+    if run['tier'] != 'full':
+        st.caption("This explanation was made in a lighter mode because the service is busy."
+                   + (" Its images are generated when you ask for them." if deferred else ""))
+    with st.expander("Fix this explanation", expanded=bool(missing)):
+        action = None
+        label = f"Generate {len(missing)} image(s)" if deferred else f"Regenerate {len(missing)} missing image(s)"
+        if missing and st.button(label, key=f"regenerate_images_{run_id}"):
+            action = ("Regenerating images...", 'regenerate_images', {'run_id': run_id, 'step_numbers': missing})
+
+        step_number = st.selectbox(
+            "Step",
+            [step['step_number'] for step in parsed_response['steps']],
+            format_func=lambda number: f"Step {number}",
+            key=f"regenerate_step_number_{run_id}",
+        )
+        if st.button("Rewrite this step", key=f"regenerate_step_{run_id}"):
+            action = (f"Rewriting step {step_number}...", 'regenerate_step', {'run_id': run_id, 'step_number': step_number})
+
+        if action is None:
+            return
+        message, kind, payload = action
+        try:
+            with st.spinner(message):
+                _regenerate(kind, **payload)
+        except Exception as e:
+            logger.error(f"Regeneration failed for run {run_id}: {e}", exc_info=True)
+            st.error("Regeneration failed. Please try again.")
+            return
+    refresh_run(run_id)
+    st.rerun()
+
+def _render_download_button(parsed_response: dict, run_id: str):
     """Render the document download button."""
-    doc_path = list(Path(output_folder).glob("*.docx"))[0]
-    with open(doc_path, "rb") as file:
-        st.download_button(
-            label="📄 Download Document",
-            data=file,
-            file_name=f"explanation.docx",
-            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-        ) 
\ No newline at end of file
+    from utils.document_helpers import get_document_bytes
+
+    with st.spinner("Preparing document..."):
+        doc_bytes = get_document_bytes(parsed_response, run_id)
+    st.download_button(
+        label="📄 Download Document",
+        data=doc_bytes,
+        file_name=f"explanation.docx",
+        mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+    ) 
\ No newline at end of file
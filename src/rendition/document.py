@@ -1,13 +1,15 @@
-from docx import Document
 import streamlit as st
-from pathlib import Path
-from PIL import Image
 import logging
+from config.config_manager import ConfigManager
+from utils.run_index import get_run_index
+from utils.image_variants import get_image_variant
 
 logger = logging.getLogger(__name__)
 
 def render_document(doc_path: str):
     """Render the document content."""
+    from docx import Document
+
     doc = Document(doc_path)
     
     for paragraph in doc.paragraphs:
@@ -16,14 +18,14 @@ def render_document(doc_path: str):
         else:
             st.write(paragraph.text)
 
-def render_images_grid(images_folder: str):
-    """Render images in a grid layout."""
+def render_images_grid(run_id: str):
+    """Render a run's images in a grid layout."""
     try:
-        image_files = sorted(Path(images_folder).glob("*.png"))
-        image_files = list(image_files)
+        step_images = get_run_index().step_images(run_id)
+        image_files = [step_images[step_number] for step_number in sorted(step_images)]
         
         if not image_files:
-            logger.warning(f"No images found in folder: {images_folder}")
+            logger.warning(f"No images found for run: {run_id}")
             st.warning("No images available to display.")
             return
         
@@ -34,9 +36,8 @@ def render_images_grid(images_folder: str):
             col_idx = idx % num_cols
             with cols[col_idx]:
                 try:
-                    image = Image.open(img_path)
                     st.image(
-                        image, 
+                        get_image_variant(img_path, ConfigManager().get('image_variants.layout.grid')), 
                         caption=f"Step {idx + 1}", 
                         use_container_width=True
                     )
@@ -0,0 +1,49 @@
+import streamlit as st
+import logging
+from typing import Dict, Optional
+from config.config_manager import ConfigManager
+from utils.cache_helpers import normalize_intent
+from utils.run_index import get_run_index
+
+logger = logging.getLogger(__name__)
+
+# Streamlit reruns the whole script on every widget interaction; finished runs are kept
+# in the session so a rerun re-renders them instead of generating them again.
+#   run_ids:     normalized intent -> run id, oldest first
+#   run_results: run id -> {'user_intent', 'run_id', 'parsed_response', 'output_folder'}
+
+def _memo():
+    return st.session_state.setdefault('run_ids', {}), st.session_state.setdefault('run_results', {})
+
+def remember_run(user_intent: str, result: Dict):
+    """Keep a finished run in the session, evicting the oldest beyond app.session_max_runs."""
+    run_ids, run_results = _memo()
+    key = normalize_intent(user_intent)
+    previous = run_ids.pop(key, None)
+    if previous is not None:
+        run_results.pop(previous, None)
+    run_ids[key] = result['run_id']
+    run_results[result['run_id']] = {
+        'user_intent': user_intent,
+        'run_id': result['run_id'],
+        'parsed_response': result['parsed_response'],
+        'output_folder': result['output_folder'],
+    }
+    while len(run_ids) > ConfigManager().get('app.session_max_runs'):
+        oldest = next(iter(run_ids))
+        run_results.pop(run_ids.pop(oldest), None)
+
+def recall_run(user_intent: str) -> Optional[Dict]:
+    """Return the finished run of this session for an intent, if there is one."""
+    run_ids, run_results = _memo()
+    run_id = run_ids.get(normalize_intent(user_intent))
+    return run_results.get(run_id) if run_id is not None else None
+
+def refresh_run(run_id: str):
+    """Reload a remembered run's explanation from the run index, e.g. after one of its steps was rewritten."""
+    _, run_results = _memo()
+    memo = run_results.get(run_id)
+    run = get_run_index().get_run(run_id)
+    if memo is not None and run is not None and isinstance(run['explanation'], dict):
+        memo['parsed_response'] = run['explanation']
+        logger.debug(f"Refreshed remembered run: {run_id}")
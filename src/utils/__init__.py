@@ -1,15 +1,163 @@
-from .logging_setup import setup_logging
-from .yaml_helpers import parse_yaml_response, clean_yaml_string
-from .openai_helpers import get_completion, load_system_prompt
-from .image_helpers import generate_and_save_images
-from .document_helpers import display_explanation
+"""Utilities package.
+
+Submodules are imported on first attribute access, so `from utils import setup_logging`
+does not pull in openai, httpx, docx or PIL until a rerun actually needs them.
+"""
+import importlib
+
+_LAZY_ATTRIBUTES = {
+    'setup_logging': 'logging_setup',
+    'parse_yaml_response': 'yaml_helpers',
+    'clean_yaml_string': 'yaml_helpers',
+    'StepStreamParser': 'yaml_helpers',
+    'extract_yaml_fields': 'yaml_helpers',
+    'Explanation': 'schema_helpers',
+    'Step': 'schema_helpers',
+    'JsonStepStreamParser': 'schema_helpers',
+    'parse_explanation': 'schema_helpers',
+    'validate_explanation': 'schema_helpers',
+    'metrics': 'metrics_helpers',
+    'span': 'metrics_helpers',
+    'start_metrics': 'metrics_helpers',
+    'export_metrics': 'metrics_helpers',
+    'CompletionCache': 'cache_helpers',
+    'get_completion_cache': 'cache_helpers',
+    'normalize_intent': 'cache_helpers',
+    'PromptRegistry': 'prompt_helpers',
+    'get_prompt_registry': 'prompt_helpers',
+    'build_messages': 'prompt_helpers',
+    'get_async_client': 'client_helpers',
+    'get_http_client': 'client_helpers',
+    'run_async': 'client_helpers',
+    'AdaptiveRateLimiter': 'rate_limiter',
+    'get_rate_limiter': 'rate_limiter',
+    'get_rate_limiter_stats': 'rate_limiter',
+    'with_priority': 'rate_limiter',
+    'PRIORITY_INTERACTIVE': 'rate_limiter',
+    'PRIORITY_BACKGROUND': 'rate_limiter',
+    'get_completion': 'openai_helpers',
+    'get_completion_async': 'openai_helpers',
+    'stream_completion': 'openai_helpers',
+    'load_system_prompt': 'openai_helpers',
+    'is_completion_cached': 'openai_helpers',
+    'ImageStore': 'image_store',
+    'get_image_variant': 'image_variants',
+    'make_variants': 'image_variants',
+    'get_variant_cache_stats': 'image_variants',
+    'get_document_image': 'image_variants',
+    'postprocess_image': 'image_postprocess',
+    'get_image_store': 'image_store',
+    'RunIndex': 'run_index',
+    'JobQueue': 'job_queue',
+    'get_job_queue': 'job_queue',
+    'get_run_index': 'run_index',
+    'generate_and_save_images': 'image_helpers',
+    'generate_completion_and_images': 'image_helpers',
+    'make_run_id': 'image_helpers',
+    'fill_missing_images': 'image_helpers',
+    'display_explanation': 'document_helpers',
+    'build_document': 'document_helpers',
+    'schedule_document': 'document_helpers',
+    'get_document': 'document_helpers',
+    'get_document_bytes': 'document_helpers',
+    'rebuild_document': 'document_helpers',
+    'regenerate_images': 'regenerate_helpers',
+    'regenerate_step_text': 'regenerate_helpers',
+    'incomplete_steps': 'regenerate_helpers',
+    'SingleFlight': 'pipeline_helpers',
+    'generate_explanation': 'pipeline_helpers',
+    'get_coalescing_stats': 'pipeline_helpers',
+    'preload_pipeline': 'pipeline_helpers',
+    'get_run_result': 'pipeline_helpers',
+    'IntentIndex': 'intent_index',
+    'get_intent_index': 'intent_index',
+    'find_similar_run': 'intent_index',
+    'start_explanation': 'pipeline_helpers',
+    'LoadPolicy': 'load_policy',
+    'get_load_policy': 'load_policy',
+    'get_service_tier': 'load_policy',
+}
+
+def __getattr__(name):
+    module_name = _LAZY_ATTRIBUTES.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
 
 __all__ = [
     'setup_logging',
     'parse_yaml_response',
     'clean_yaml_string',
+    'StepStreamParser',
+    'extract_yaml_fields',
+    'Explanation',
+    'Step',
+    'JsonStepStreamParser',
+    'parse_explanation',
+    'validate_explanation',
+    'metrics',
+    'span',
+    'start_metrics',
+    'export_metrics',
+    'CompletionCache',
+    'get_completion_cache',
+    'normalize_intent',
+    'PromptRegistry',
+    'get_prompt_registry',
+    'build_messages',
+    'get_async_client',
+    'get_http_client',
+    'run_async',
+    'AdaptiveRateLimiter',
+    'get_rate_limiter',
+    'get_rate_limiter_stats',
+    'with_priority',
+    'PRIORITY_INTERACTIVE',
+    'PRIORITY_BACKGROUND',
     'get_completion',
+    'get_completion_async',
+    'stream_completion',
     'load_system_prompt',
+    'is_completion_cached',
+    'ImageStore',
+    'get_image_variant',
+    'make_variants',
+    'get_variant_cache_stats',
+    'get_document_image',
+    'postprocess_image',
+    'get_image_store',
+    'RunIndex',
+    'JobQueue',
+    'get_job_queue',
+    'get_run_index',
     'generate_and_save_images',
-    'display_explanation'
+    'generate_completion_and_images',
+    'make_run_id',
+    'fill_missing_images',
+    'display_explanation',
+    'build_document',
+    'schedule_document',
+    'get_document',
+    'get_document_bytes',
+    'rebuild_document',
+    'regenerate_images',
+    'regenerate_step_text',
+    'incomplete_steps',
+    'SingleFlight',
+    'generate_explanation',
+    'get_coalescing_stats',
+    'preload_pipeline',
+    'get_run_result',
+    'IntentIndex',
+    'get_intent_index',
+    'find_similar_run',
+    'start_explanation',
+    'LoadPolicy',
+    'get_load_policy',
+    'get_service_tier'
 ] 
\ No newline at end of file
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import unicodedata
+from pathlib import Path
+from typing import Dict, Optional
+from config.config_manager import ConfigManager
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever normalize_intent changes, so keys built with the old normalization are not reused
+NORMALIZATION_VERSION = 1
+
+def normalize_intent(user_intent: str) -> str:
+    """Normalize a user intent so trivially different spellings share a cache entry.
+
+    Only the Unicode form, case, spacing and a trailing "?", "!" or "." are
+    normalized: symbols name different concepts ("C++", "C#" and "C", "A*", ".NET").
+    """
+    text = ' '.join(unicodedata.normalize('NFKC', user_intent).casefold().split())
+    return text.rstrip('?!. ')
+
+def hash_text(text: str) -> str:
+    """Return the SHA-256 hex digest of a string."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def atomic_write(path: Path, data: bytes) -> None:
+    """Write data to path atomically so concurrent readers never see a partial file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.tmp_')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+class CompletionCache:
+    """Content-addressed, size-bounded on-disk LRU cache for chat completions.
+
+    Each entry is a JSON file named after its key. Recency is tracked through the
+    file's mtime, which is bumped on every hit, and the least recently used entries
+    are evicted once max_entries or max_bytes is exceeded.
+    """
+
+    def __init__(self, cache_dir: str, max_entries: int, max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def make_key(user_intent: str, prompt_hash: str, model: str, temperature: float, max_tokens: int) -> str:
+        """Build the cache key from everything that determines the completion."""
+        payload = json.dumps({
+            'intent': normalize_intent(user_intent),
+            'normalization': NORMALIZATION_VERSION,
+            'prompt': prompt_hash,
+            'model': model,
+            'temperature': temperature,
+            'max_tokens': max_tokens,
+        }, sort_keys=True)
+        return hash_text(payload)
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached completion for key, or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            os.utime(path)
+        except (FileNotFoundError, json.JSONDecodeError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        logger.info(f"Completion cache hit for '{entry.get('intent')}' ({self.hits} hits, {self.misses} misses)")
+        return entry['completion']
+
+    def contains(self, key: str) -> bool:
+        """Return whether key is cached, without counting a lookup or refreshing its recency."""
+        return self._path(key).exists()
+
+    def set(self, key: str, completion: str, user_intent: str) -> None:
+        """Store a completion and evict least recently used entries if over budget."""
+        entry = {
+            'intent': normalize_intent(user_intent),
+            'completion': completion,
+            'created_at': time.time(),
+        }
+        atomic_write(self._path(key), json.dumps(entry).encode('utf-8'))
+        self._evict()
+
+    def _evict(self) -> None:
+        entries = []
+        for path in self.cache_dir.glob('*.json'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        entries.sort()
+        total_bytes = sum(size for _, size, _ in entries)
+        while entries and (len(entries) > self.max_entries or total_bytes > self.max_bytes):
+            _, size, path = entries.pop(0)
+            try:
+                path.unlink()
+                logger.debug(f"Evicted completion cache entry: {path.name}")
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+
+    def stats(self) -> Dict:
+        """Return hit/miss counters for this process."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+_completion_cache: Optional[CompletionCache] = None
+_completion_cache_lock = threading.Lock()
+
+def get_completion_cache() -> Optional[CompletionCache]:
+    """Return the process-wide completion cache, or None if caching is disabled."""
+    global _completion_cache
+    config = ConfigManager()
+    if not config.get('cache.completions.enabled'):
+        return None
+    with _completion_cache_lock:
+        if _completion_cache is None:
+            _completion_cache = CompletionCache(
+                config.get('cache.completions.dir'),
+                config.get('cache.completions.max_entries'),
+                config.get('cache.completions.max_bytes'),
+            )
+    return _completion_cache
@@ -0,0 +1,84 @@
+import asyncio
+import atexit
+import logging
+import threading
+from typing import Any, Coroutine, Optional
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from config.config_manager import ConfigManager
+from utils.load_policy import service_tier, with_tier
+from utils.rate_limiter import request_priority, with_priority
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_thread: Optional[threading.Thread] = None
+_http_client: Optional[httpx.AsyncClient] = None
+_openai_client: Optional[AsyncOpenAI] = None
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """Return the process-wide event loop, starting its background thread on first use.
+
+    All OpenAI and HTTP traffic runs on this one loop so that the connection pool
+    (which is bound to the loop it was first used on) is shared by every caller.
+    """
+    global _loop, _loop_thread
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(target=_loop.run_forever, name="openai-event-loop", daemon=True)
+            _loop_thread.start()
+            logger.debug("Started shared event loop thread")
+    return _loop
+
+def run_async(coro: Coroutine) -> Any:
+    """Run a coroutine on the shared event loop and block until it finishes.
+
+    API calls made by the coroutine are scheduled at the calling thread's
+    request priority, and generate at its service tier.
+    """
+    loop = get_event_loop()
+    if threading.current_thread() is _loop_thread:
+        raise RuntimeError("run_async cannot be called from the shared event loop; await the coroutine instead")
+    return asyncio.run_coroutine_threadsafe(
+        with_priority(request_priority.get(), with_tier(service_tier.get(), coro)), loop
+    ).result()
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the process-wide keep-alive HTTP client used for OpenAI and image downloads."""
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            config = ConfigManager()
+            limits = httpx.Limits(
+                max_connections=config.get('http.max_connections'),
+                max_keepalive_connections=config.get('http.max_keepalive_connections'),
+                keepalive_expiry=config.get('http.keepalive_expiry'),
+            )
+            _http_client = DefaultAsyncHttpxClient(limits=limits, timeout=config.get('http.timeout'))
+            logger.debug(f"Created shared HTTP client with {limits}")
+    return _http_client
+
+def get_async_client() -> AsyncOpenAI:
+    """Return the process-wide AsyncOpenAI client shared by the chat and image paths."""
+    global _openai_client
+    http_client = get_http_client()
+    with _lock:
+        if _openai_client is None:
+            config = ConfigManager()
+            # Retries are handled by the rate limiter so that 429s feed its AIMD control
+            _openai_client = AsyncOpenAI(api_key=config.get('openai.api_key'), http_client=http_client, max_retries=0)
+    return _openai_client
+
+def _shutdown() -> None:
+    if _loop is None or not _loop.is_running():
+        return
+    if _http_client is not None:
+        try:
+            asyncio.run_coroutine_threadsafe(_http_client.aclose(), _loop).result(timeout=5)
+        except Exception as e:
+            logger.debug(f"Error closing shared HTTP client: {e}")
+    _loop.call_soon_threadsafe(_loop.stop)
+
+atexit.register(_shutdown)
@@ -1,55 +1,135 @@
-from docx import Document
-from docx.shared import Inches
+import io
 import os
-from datetime import datetime
 import logging
-from typing import Union, Dict
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Union, Dict, Optional
+from config.config_manager import ConfigManager
+from utils.cache_helpers import atomic_write
 from utils.image_helpers import generate_and_save_images
+from utils.run_index import get_run_index
+from utils.metrics_helpers import span
 
 logger = logging.getLogger(__name__)
 
-def display_explanation(explanation_dict: Dict, user_intent: str):
-    """Display the parsed explanation and generate document."""
+_document_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="docx")
+_document_builds: Dict[str, Future] = {}
+_document_builds_lock = threading.Lock()
+
+def document_path(run_id: str) -> Path:
+    """Return where the document for a run is stored."""
+    return Path("output") / run_id / "explanation.docx"
+
+def _prepare_document_image(image_path: Path) -> io.BytesIO:
+    """Return the downscaled, recompressed copy of an image for embedding in the document."""
+    from utils.image_variants import get_document_image
+
+    return io.BytesIO(get_document_image(image_path))
+
+def build_document(explanation_dict: Dict, run_id: str) -> Path:
+    """Build the explanation document for a run and save it as a cached artifact."""
+    with span('docx', trace_id=run_id):
+        doc_path = _build_document(explanation_dict, run_id)
+    get_run_index().update_run(run_id, document_path=str(doc_path))
+    return doc_path
+
+def _build_document(explanation_dict: Dict, run_id: str) -> Path:
+    from docx import Document
+    from docx.shared import Inches
+
+    config = ConfigManager()
+    start_time = time.time()
+    doc = Document()
+    
+    doc.add_heading(explanation_dict['title'], 0)
+    doc.add_paragraph(explanation_dict['introduction'])
+    
+    step_images = get_run_index().step_images(run_id)
+    logger.info(f"Resolved {len(step_images)} images for run: {run_id}")
+    
+    for step in explanation_dict['steps']:
+        doc.add_heading(f"{step['heading']}", level=1)
+        doc.add_paragraph(step['text'])
+        
+        image_path = step_images.get(step['step_number'])
+        if image_path is not None and image_path.exists():
+            desc_para = doc.add_paragraph()
+            desc_para.add_run(step['image_description'])
+            doc.add_picture(_prepare_document_image(image_path), width=Inches(config.get('document.image_width_inches')))
+
+        if 'transition' in step:
+            transition_para = doc.add_paragraph()
+            transition_para.add_run(step['transition'])
+    
+    doc.add_heading('Conclusion', level=1)
+    doc.add_paragraph(explanation_dict['conclusion'])
+    
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    doc_path = document_path(run_id)
+    atomic_write(doc_path, buffer.getvalue())
+    logger.info(f"Document saved as: {doc_path} ({len(buffer.getvalue()) / 1024:.0f} KB in {time.time() - start_time:.2f}s)")
+    return doc_path
+
+def schedule_document(explanation_dict: Dict, run_id: str) -> Future:
+    """Start building a run's document in the background, at most once per run."""
+    with _document_builds_lock:
+        future = _document_builds.get(run_id)
+        if future is None:
+            future = _document_executor.submit(build_document, explanation_dict, run_id)
+            _document_builds[run_id] = future
+            future.add_done_callback(lambda _: _forget_build(run_id))
+    return future
+
+def _forget_build(run_id: str) -> None:
+    with _document_builds_lock:
+        _document_builds.pop(run_id, None)
+
+def rebuild_document(explanation_dict: Dict, run_id: str) -> None:
+    """Discard a run's cached document after its content changed; in background mode it is rebuilt now."""
+    with _document_builds_lock:
+        in_flight = _document_builds.get(run_id)
+    if in_flight is not None:
+        # A build that started before the change would write a stale document after the unlink
+        wait([in_flight])
+    document_path(run_id).unlink(missing_ok=True)
+    if ConfigManager().get('document.mode') == 'background':
+        schedule_document(explanation_dict, run_id)
+
+def get_document(explanation_dict: Dict, run_id: str) -> Path:
+    """Return the run's document, waiting for or starting its build if it is not cached yet."""
+    doc_path = document_path(run_id)
+    if doc_path.exists():
+        return doc_path
+    return schedule_document(explanation_dict, run_id).result()
+
+def get_document_bytes(explanation_dict: Dict, run_id: str) -> bytes:
+    """Return the run's document contents for serving."""
+    return get_document(explanation_dict, run_id).read_bytes()
+
+def display_explanation(explanation_dict: Dict, user_intent: str, run_id: Optional[str] = None):
+    """Display the parsed explanation and generate document.
+
+    If run_id is given the step images were already generated for that run (e.g.
+    while streaming the completion); otherwise they are generated here. The
+    document is built off the critical path: in the background when
+    document.mode is "background", or on first request when it is "on_demand".
+    """
     logger.info("Starting explanation display")
     
     try:
-        doc = Document()
-        
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        sanitized_intent = "".join(c for c in user_intent if c.isalnum() or c in (' ', '-', '_')).strip()
-        sanitized_intent = sanitized_intent.replace(' ', '_').lower()
-        output_folder = os.path.join("output", f"{timestamp}_{sanitized_intent}")
+        if run_id is None:
+            run_id = generate_and_save_images(explanation_dict, user_intent)
+        output_folder = os.path.join("output", run_id)
         os.makedirs(output_folder, exist_ok=True)
         
-        doc.add_heading(explanation_dict['title'], 0)
-        doc.add_paragraph(explanation_dict['introduction'])
-        
-        images_folder = generate_and_save_images(explanation_dict, user_intent)
-        logger.info(f"Images saved in: {images_folder}")
-        
-        for step in explanation_dict['steps']:
-            doc.add_heading(f"{step['heading']}", level=1)
-            doc.add_paragraph(step['text'])
-            
-            image_path = os.path.join(images_folder, f"step_{step['step_number']}.png")
-            if os.path.exists(image_path):
-                desc_para = doc.add_paragraph()
-                desc_para.add_run(step['image_description'])
-                doc.add_picture(image_path, width=Inches(6))
-
-            if 'transition' in step:
-                transition_para = doc.add_paragraph()
-                transition_para.add_run(step['transition'])
-        
-        doc.add_heading('Conclusion', level=1)
-        doc.add_paragraph(explanation_dict['conclusion'])
-        
-        doc_path = os.path.join(output_folder, f"{sanitized_intent}.docx")
-        doc.save(doc_path)
-        logger.info(f"Document saved as: {doc_path}")
+        if ConfigManager().get('document.mode') == 'background':
+            schedule_document(explanation_dict, run_id)
         
         return output_folder
         
     except Exception as e:
         logger.error("Error creating explanation document", exc_info=True)
-        raise 
\ No newline at end of file
+        raise
@@ -1,118 +1,367 @@
 import asyncio
-import aiohttp
+import base64
+import hashlib
+import random
 import time
-from typing import Dict, List
-import os
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple, Union
 import logging
-from openai import OpenAI
+from openai import AsyncOpenAI, AuthenticationError, BadRequestError, PermissionDeniedError
+from openai.types import Image
 from config.config_manager import ConfigManager
-from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from utils.client_helpers import get_async_client, get_http_client, run_async
+from utils.image_store import ImageStore, get_image_store
+from utils.image_postprocess import postprocess_image
+from utils.load_policy import get_service_tier
+from utils.metrics_helpers import metrics, span
+from utils.openai_helpers import get_completion_async, stream_completion
+from utils.rate_limiter import call_with_limit, request_priority
+from utils.run_index import get_run_index
+from utils.schema_helpers import make_step_parser, parse_explanation
 
 logger = logging.getLogger(__name__)
 
-def generate_dalle_image(client: OpenAI, prompt: str) -> str:
-    """Generate DALL-E image in a separate thread."""
-    config = ConfigManager()
+ProgressCallback = Callable[[Dict], None]
+
+metrics.describe('simplifygpt_step_retries_total', 'Step images retried after a failed attempt.')
+
+def notify(on_event: Optional[ProgressCallback], **event) -> None:
+    """Report a progress event (e.g. to the UI); a failing listener never breaks generation."""
+    if on_event is None:
+        return
+    try:
+        on_event(event)
+    except Exception as e:
+        logger.warning(f"Progress listener failed on {event.get('type')} event: {e}")
+
+def make_run_id(user_intent: str) -> str:
+    """Create a unique, timestamped id for one generated explanation.
+
+    The random suffix keeps ids apart when intents sanitize to the same text in
+    the same second ("C++ templates" and "C templates").
+    """
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    sanitized_intent = "".join(c for c in user_intent if c.isalnum() or c in (' ', '-', '_')).strip()
+    sanitized_intent = sanitized_intent.replace(' ', '_').lower()
+    return f"{timestamp}_{sanitized_intent}_{uuid.uuid4().hex[:8]}"
+
+def build_image_prompt(image_description: str) -> str:
+    """Build the final DALL-E prompt from a step's image description."""
     # Remove first word from prompt
-    prompt_words = prompt.split()
+    prompt_words = image_description.split()
     if len(prompt_words) > 1:
-        prompt = ' '.join(prompt_words[1:])
-        logger.info(f"Generating DALL-E image with prompt: {prompt}")
-    response = client.images.generate(
+        return ' '.join(prompt_words[1:])
+    return image_description
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+async def generate_dalle_image(client: AsyncOpenAI, prompt: str) -> Image:
+    """Request a DALL-E image, returned inline as base64 or as a URL depending on config."""
+    config = ConfigManager()
+    logger.info(f"Generating DALL-E image with prompt: {prompt}")
+    response = await call_with_limit(
+        'images',
+        client.images.generate,
         model="dall-e-3",
         prompt=prompt,
         size=config.get('image_generation.size'),
         quality=config.get('image_generation.quality'),
+        response_format=config.get('image_generation.response_format'),
         n=1,
     )
-    return response.data[0].url
+    return response.data[0]
+
+def _store_base64(store: ImageStore, prompt_key: str, b64_json: str, prompt: str) -> str:
+    """Decode an inline base64 image and write it to the store."""
+    return store.put(prompt_key, base64.b64decode(b64_json), prompt)
+
+async def download_image_to_store(url: str, prompt_key: str, prompt: str) -> str:
+    """Stream an image to disk in chunks, hashing as it arrives, and add it to the store."""
+    store = get_image_store()
+    tmp_path = await asyncio.to_thread(store.new_temp_path)
+    digest = hashlib.sha256()
+    try:
+        f = await asyncio.to_thread(open, tmp_path, 'wb')
+        try:
+            async with get_http_client().stream('GET', url) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                    digest.update(chunk)
+                    await asyncio.to_thread(f.write, chunk)
+        finally:
+            await asyncio.to_thread(f.close)
+        return await asyncio.to_thread(store.put_file, prompt_key, tmp_path, digest.hexdigest(), prompt)
+    except BaseException:
+        if tmp_path.exists():
+            tmp_path.unlink()
+        raise
+
+# Errors another attempt won't fix, e.g. a prompt rejected by the content policy
+PERMANENT_IMAGE_ERRORS = (AuthenticationError, BadRequestError, PermissionDeniedError)
+
+def step_retry_delay(attempt: int) -> float:
+    """Return a full-jitter exponential backoff delay before retrying a step after its attempt-th failure."""
+    config = ConfigManager()
+    ceiling = min(
+        config.get('image_generation.step_retry_max_delay'),
+        config.get('image_generation.step_retry_base_delay') * 2 ** (attempt - 1),
+    )
+    return random.uniform(0, ceiling)
+
+async def _generate_step_image(client: AsyncOpenAI, prompt: str, prompt_key: str, run_id: str) -> str:
+    """Generate one image and add it to the store, returning its digest."""
+    store = get_image_store()
+    with span('image_generate', trace_id=run_id):
+        image = await generate_dalle_image(client, prompt)
+    
+    if image.b64_json:
+        # Bytes came back inline; decode and write off the event loop
+        with span('image_save', trace_id=run_id):
+            return await asyncio.to_thread(_store_base64, store, prompt_key, image.b64_json, prompt)
+    # Stream the download to disk over the shared connection pool
+    with span('image_download', trace_id=run_id):
+        return await download_image_to_store(image.url, prompt_key, prompt)
 
 async def generate_single_image(
-    client: OpenAI, 
+    client: AsyncOpenAI, 
     step: Dict, 
-    folder_name: str,
-    session: aiohttp.ClientSession,
-    executor: ThreadPoolExecutor,
-    start_time: float
+    run_images: Dict[int, str],
+    run_id: str,
+    on_event: Optional[ProgressCallback] = None,
+    force: bool = False
 ) -> None:
-    """Generate and save a single image asynchronously."""
+    """Generate and store a single image asynchronously, reusing a stored image for a repeat prompt.
+
+    With force, a new image is generated even if one is stored for the prompt
+    (an explicit request to regenerate a step that already has its image).
+
+    A failed step is retried as a whole (generation, download and storage) with
+    jittered exponential backoff, on top of the API-level retries of throttled
+    calls. Under load, the service tier may defer the image until the reader
+    asks for it. Reports an "image" event with the stored path (None on failure
+    or deferral) when done and records the step's status and attempts in the run index.
+    """
+    config = ConfigManager()
+    store = get_image_store()
+    run_index = get_run_index()
+    images_mode = get_service_tier()['images']
     step_num = step['step_number']
+    start_time = time.time()
+    status, error, attempts = 'ok', None, 0
     try:
-        logger.info(f"[Step {step_num}] Starting image generation at {time.time() - start_time:.2f}s")
-        
-        # Run DALL-E generation in thread pool
-        loop = asyncio.get_event_loop()
-        image_url = await loop.run_in_executor(
-            executor, 
-            generate_dalle_image, 
-            client, 
-            step['image_description']
+        if images_mode == 'on_demand':
+            status = 'deferred'
+            metrics.inc('simplifygpt_images_total', source='deferred')
+            logger.info(f"[Step {step_num}] Image deferred until requested")
+            return
+
+        prompt = build_image_prompt(step['image_description'])
+        prompt_key = ImageStore.make_prompt_key(
+            prompt,
+            config.get('image_generation.size'),
+            config.get('image_generation.quality'),
         )
+        digest = None if force else store.lookup(prompt_key)
+        if digest is not None:
+            run_images[step_num] = digest
+            status = 'reused'
+            metrics.inc('simplifygpt_images_total', source='store')
+            logger.info(f"[Step {step_num}] Reused stored image {digest}")
+            return
+        if images_mode == 'stored':
+            status = 'deferred'
+            metrics.inc('simplifygpt_images_total', source='deferred')
+            logger.info(f"[Step {step_num}] No stored image; deferred until requested")
+            return
         
-        logger.info(f"[Step {step_num}] Got DALL-E response at {time.time() - start_time:.2f}s")
+        max_attempts = config.get('image_generation.step_attempts')
+        for attempts in range(1, max_attempts + 1):
+            try:
+                run_images[step_num] = await _generate_step_image(client, prompt, prompt_key, run_id)
+                break
+            except PERMANENT_IMAGE_ERRORS:
+                raise
+            except Exception as e:
+                if attempts == max_attempts:
+                    raise
+                delay = step_retry_delay(attempts)
+                metrics.inc('simplifygpt_step_retries_total')
+                logger.warning(f"[Step {step_num}] Attempt {attempts} failed: {e}; retrying in {delay:.1f}s")
+                await asyncio.to_thread(run_index.set_step, run_id, step_num, 'retrying', None, None, str(e), attempts)
+                await asyncio.sleep(delay)
         
-        # Download image
-        async with session.get(image_url) as response:
-            logger.info(f"[Step {step_num}] Starting image download at {time.time() - start_time:.2f}s")
-            image_data = await response.read()
-            logger.info(f"[Step {step_num}] Completed download at {time.time() - start_time:.2f}s")
+        metrics.inc('simplifygpt_images_total', source='generated')
+        logger.info(f"[Step {step_num}] Stored image {run_images[step_num]}")
         
-        # Save image
-        image_path = f"{folder_name}/step_{step_num}.png"
-        with open(image_path, 'wb') as f:
-            f.write(image_data)
-            
-        logger.info(f"[Step {step_num}] Saved image at {time.time() - start_time:.2f}s")
+        # Display and document copies are made once now, so no consumer decodes the full-size image
+        try:
+            with span('image_postprocess', trace_id=run_id):
+                digest = await postprocess_image(run_images[step_num], prompt_key)
+            if digest != run_images[step_num]:
+                # Only ever an image generated for this same prompt key
+                run_images[step_num] = digest
+                await asyncio.to_thread(store.link, prompt_key, digest, prompt)
+        except Exception as e:
+            logger.warning(f"[Step {step_num}] Could not post-process image: {e}")
         
     except Exception as e:
-        logger.error(f"[Step {step_num}] Error at {time.time() - start_time:.2f}s: {e}", exc_info=True)
+        status, error = 'failed', str(e)
+        metrics.inc('simplifygpt_images_total', source='failed')
+        logger.error(f"[Step {step_num}] Image generation failed after {attempts} attempt(s): {e}", exc_info=True)
+    finally:
+        digest = run_images.get(step_num)
+        try:
+            await asyncio.to_thread(
+                run_index.set_step, run_id, step_num, status, digest, round(time.time() - start_time, 4), error, attempts
+            )
+        except Exception as e:
+            logger.warning(f"[Step {step_num}] Could not record step in the run index: {e}")
+        notify(on_event, type='image', step_number=step_num, path=store.blob_path(digest) if digest else None)
 
-async def generate_images_async(explanation_dict: Dict, folder_name: str) -> None:
-    """Generate all images concurrently."""
-    config = ConfigManager()
-    client = OpenAI(api_key=config.get('openai.api_key'))
-    start_time = time.time()
+async def generate_images_async(
+    explanation_dict: Dict,
+    run_id: str,
+    on_event: Optional[ProgressCallback] = None,
+    force: bool = False
+) -> None:
+    """Generate all images concurrently; with force, stored images of the same prompts are not reused."""
+    client = get_async_client()
+    run_images: Dict[int, str] = {}
     
     logger.info(f"Starting concurrent image generation for {len(explanation_dict['steps'])} steps")
     
-    # Create thread pool for DALL-E API calls
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        async with aiohttp.ClientSession() as session:
-            tasks = [
-                generate_single_image(client, step, folder_name, session, executor, start_time)
-                for step in explanation_dict['steps']
-            ]
-            logger.info(f"Created {len(tasks)} concurrent tasks at {time.time() - start_time:.2f}s")
+    with span('images', trace_id=run_id):
+        await asyncio.gather(*[
+            generate_single_image(client, step, run_images, run_id, on_event, force)
+            for step in explanation_dict['steps']
+        ])
+
+async def generate_images_from_stream(
+    user_intent: str,
+    run_id: str,
+    on_event: Optional[ProgressCallback] = None,
+    refresh: bool = False
+) -> str:
+    """Stream the completion and start each step's image as soon as its description is complete.
+
+    Top-level fields and steps are reported as "field" and "step" events as soon as they are parsed.
+    With refresh, neither a cached completion nor stored images of the same prompts are reused.
+    """
+    client = get_async_client()
+    parser = make_step_parser(lambda name, value: notify(on_event, type='field', name=name, value=value))
+    parts: List[str] = []
+    tasks: List[asyncio.Task] = []
+    run_images: Dict[int, str] = {}
+    
+    logger.info("Starting streamed completion with overlapping image generation")
+    
+    def start_steps(steps: List[Dict]) -> None:
+        for step in steps:
+            logger.debug(f"[Step {step['step_number']}] Description streamed; starting image")
+            notify(on_event, type='step', step=step)
+            tasks.append(asyncio.create_task(generate_single_image(client, step, run_images, run_id, on_event, refresh)))
+    
+    with span('completion_and_images', trace_id=run_id):
+        try:
+            async for chunk in stream_completion(user_intent, run_id, refresh):
+                parts.append(chunk)
+                start_steps(parser.feed(chunk))
+            start_steps(parser.close())
+        finally:
             await asyncio.gather(*tasks)
-            
-    logger.info(f"All tasks completed at {time.time() - start_time:.2f}s")
+    
+    return ''.join(parts)
+
+async def generate_missing_images(
+    explanation_dict: Dict,
+    run_id: str,
+    on_event: Optional[ProgressCallback] = None,
+    force: bool = False
+) -> int:
+    """Generate images for the steps of a run that were never started, e.g. because their descriptions were repaired.
+
+    Steps already attempted are left alone, including failed ones: they used up
+    their attempts, and are regenerated only on request (see regenerate_images).
+    """
+    started = await asyncio.to_thread(get_run_index().started_steps, run_id)
+    missing = [step for step in explanation_dict['steps'] if step['step_number'] not in started]
+    if not missing:
+        return 0
 
-def generate_and_save_images(explanation_dict: Dict, user_intent: str) -> str:
-    """Generate DALL-E images for each step and save them."""
+    logger.info(f"Generating {len(missing)} missing image(s) for run: {run_id}")
+    client = get_async_client()
+    run_images: Dict[int, str] = {}
+    await asyncio.gather(*[generate_single_image(client, step, run_images, run_id, on_event, force) for step in missing])
+    return len(missing)
+
+def fill_missing_images(
+    explanation_dict: Dict,
+    run_id: str,
+    on_event: Optional[ProgressCallback] = None,
+    force: bool = False
+) -> int:
+    """Generate the images of steps never started in a run and return how many were attempted."""
+    return run_async(generate_missing_images(explanation_dict, run_id, on_event, force))
+
+def generate_completion_and_images(
+    user_intent: str,
+    on_event: Optional[ProgressCallback] = None,
+    refresh: bool = False
+) -> Tuple[str, Union[Dict, str], str]:
+    """Generate the explanation text and its images, overlapping the two when streaming is enabled.
+
+    Returns the raw completion, its parsed explanation (see parse_explanation,
+    invalid fields already repaired) and the run id under which the images were
+    recorded. Progress is reported to on_event as the text and images become
+    available. With refresh, a new completion and new images are requested even
+    if they are cached or stored.
+    """
+    config = ConfigManager()
     start_time = time.time()
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    run_id = make_run_id(user_intent)
+    get_run_index().start_run(run_id, user_intent, request_priority.get(), get_service_tier()['name'])
     
-    # Create unique folder name with timestamp
-    sanitized_intent = "".join(c for c in user_intent if c.isalnum() or c in (' ', '-', '_')).strip()
-    sanitized_intent = sanitized_intent.replace(' ', '_').lower()
-    folder_name = os.path.join("images", f"{timestamp}_{sanitized_intent}")
+    try:
+        if config.get('chat.stream'):
+            yaml_response = run_async(generate_images_from_stream(user_intent, run_id, on_event, refresh))
+            parsed_response = parse_explanation(yaml_response, user_intent, run_id)
+        else:
+            yaml_response = run_async(get_completion_async(user_intent, run_id, refresh))
+            parsed_response = parse_explanation(yaml_response, user_intent, run_id)
+            if isinstance(parsed_response, dict):
+                for name in ('title', 'introduction', 'conclusion'):
+                    notify(on_event, type='field', name=name, value=parsed_response[name])
+                for step in parsed_response['steps']:
+                    notify(on_event, type='step', step=step)
+                run_async(generate_images_async(parsed_response, run_id, on_event, refresh))
+    except Exception as e:
+        get_run_index().update_run(run_id, status='error', error=str(e))
+        raise
+    
+    logger.info(f"Completed completion and images in {time.time() - start_time:.2f} seconds")
+    logger.info(f"Images recorded for run: {run_id}")
+    return yaml_response, parsed_response, run_id
+
+def generate_and_save_images(explanation_dict: Dict, user_intent: str, run_id: str = None) -> str:
+    """Generate DALL-E images for each step, store them and return the run id."""
+    start_time = time.time()
+    if run_id is None:
+        run_id = make_run_id(user_intent)
+        get_run_index().start_run(run_id, user_intent, request_priority.get(), get_service_tier()['name'])
     
     logger.info(f"Starting parallel image generation for concept: {user_intent}")
     
     try:
-        os.makedirs(folder_name, exist_ok=True)
-        logger.debug(f"Created directory: {folder_name}")
-        
-        # Run async code
-        asyncio.run(generate_images_async(explanation_dict, folder_name))
+        # Run on the shared event loop
+        run_async(generate_images_async(explanation_dict, run_id))
         
         total_time = time.time() - start_time
         logger.info(f"Completed all image generations in {total_time:.2f} seconds")
-        logger.info(f"Images saved in: {folder_name}")
+        logger.info(f"Images recorded for run: {run_id}")
         
-        return folder_name
+        return run_id
         
     except Exception as e:
         logger.error(f"Error in image generation process: {e}", exc_info=True)
-        raise
\ No newline at end of file
+        raise
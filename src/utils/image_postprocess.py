@@ -0,0 +1,80 @@
+import asyncio
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+from config.config_manager import ConfigManager
+from utils.image_store import get_image_store
+from utils.image_variants import derivative_outputs, render_derivatives
+from utils.metrics_helpers import metrics
+from utils.run_index import get_run_index
+
+logger = logging.getLogger(__name__)
+
+metrics.describe('simplifygpt_image_duplicates_total', 'New images replaced by a perceptually identical stored image.')
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+def get_postprocess_pool() -> ProcessPoolExecutor:
+    """Return the process pool that decodes and encodes images, away from the event loop and the GIL."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawned, not forked: this process runs an event loop and other threads
+            _pool = ProcessPoolExecutor(
+                max_workers=ConfigManager().get('image_postprocess.processes'),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+    return _pool
+
+def start_postprocess_pool() -> None:
+    """Start the worker processes ahead of the first image, which would otherwise wait for them."""
+    pool = get_postprocess_pool()
+    for _ in range(ConfigManager().get('image_postprocess.processes')):
+        pool.submit(int)
+
+def _find_duplicate(digest: str, prompt_key: str, value: int) -> Optional[str]:
+    """Record a new image's hash and return the digest of an identical-looking image of the same prompt, if any.
+
+    Only images generated for the same prompt key are compared (e.g. the same
+    step generated concurrently by two runs), so a step never gets the picture
+    of a different prompt.
+    """
+    config = ConfigManager()
+    store = get_image_store()
+    run_index = get_run_index()
+    if config.get('image_postprocess.dedup'):
+        max_distance = config.get('image_postprocess.dedup_max_distance')
+        for other, other_value in run_index.image_hashes(prompt_key).items():
+            if other != digest and bin(value ^ other_value).count('1') <= max_distance and store.blob_path(other).exists():
+                return other
+    run_index.record_image(digest, prompt_key, value)
+    return None
+
+def _drop_duplicate(digest: str) -> None:
+    # A blob already used by a step (e.g. one stored before post-processing) stays
+    if not get_run_index().blob_in_use(digest):
+        get_image_store().discard(digest)
+
+async def postprocess_image(digest: str, prompt_key: str) -> str:
+    """Make the display and document derivatives of a newly stored image, and deduplicate it.
+
+    The image is decoded once, in a worker process. With image_postprocess.dedup,
+    if it looks the same as an image already stored for the same prompt key,
+    that image's digest is returned (and the new blob dropped) so both share one
+    set of derivatives; otherwise the digest is returned unchanged.
+    """
+    store = get_image_store()
+    loop = asyncio.get_running_loop()
+    value = await loop.run_in_executor(
+        get_postprocess_pool(), render_derivatives, str(store.blob_path(digest)), derivative_outputs(digest)
+    )
+    duplicate = await asyncio.to_thread(_find_duplicate, digest, prompt_key, value)
+    if duplicate is None:
+        return digest
+    metrics.inc('simplifygpt_image_duplicates_total')
+    logger.info(f"Blob {digest} looks the same as stored blob {duplicate} of the same prompt; reusing it")
+    await asyncio.to_thread(_drop_duplicate, digest)
+    return duplicate
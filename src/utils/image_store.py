@@ -0,0 +1,118 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+from config.config_manager import ConfigManager
+from utils.cache_helpers import atomic_write, hash_text
+
+logger = logging.getLogger(__name__)
+
+class ImageStore:
+    """Content-addressed store for generated images, deduplicated across runs.
+
+    Layout under the store root:
+        blobs/<sha256>.png   image bytes, stored once per distinct content
+        prompts/<key>.json   final DALL-E prompt (+ size/quality) -> blob
+        runs/<run_id>.json   step number -> blob, for runs made before the run index
+        variants/<sha256>_<width>.<ext>   downscaled copies of a blob for display
+        variants/<sha256>_doc<px>.jpg     the copy embedded in documents
+    """
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self.blobs_dir = self.root / "blobs"
+        self.prompts_dir = self.root / "prompts"
+        self.runs_dir = self.root / "runs"
+        self.variants_dir = self.root / "variants"
+        for folder in (self.blobs_dir, self.prompts_dir, self.runs_dir, self.variants_dir):
+            folder.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def make_prompt_key(prompt: str, size: str, quality: str) -> str:
+        """Build the key identifying an image request."""
+        return hash_text(json.dumps({'prompt': prompt, 'size': size, 'quality': quality}, sort_keys=True))
+
+    def blob_path(self, digest: str) -> Path:
+        return self.blobs_dir / f"{digest}.png"
+
+    def variant_path(self, digest: str, width: int, extension: str) -> Path:
+        return self.variants_dir / f"{digest}_{width}.{extension}"
+
+    def document_image_path(self, digest: str, max_px: int) -> Path:
+        return self.variants_dir / f"{digest}_doc{max_px}.jpg"
+
+    def lookup(self, prompt_key: str) -> Optional[str]:
+        """Return the blob digest previously generated for prompt_key, if any."""
+        try:
+            with open(self.prompts_dir / f"{prompt_key}.json", 'r', encoding='utf-8') as f:
+                digest = json.load(f)['blob']
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            return None
+        return digest if self.blob_path(digest).exists() else None
+
+    def put(self, prompt_key: str, data: bytes, prompt: str) -> str:
+        """Store image bytes for prompt_key and return the blob digest."""
+        digest = hashlib.sha256(data).hexdigest()
+        blob_path = self.blob_path(digest)
+        if blob_path.exists():
+            logger.debug(f"Image bytes already stored as blob {digest}")
+        else:
+            atomic_write(blob_path, data)
+        self.link(prompt_key, digest, prompt)
+        return digest
+
+    def new_temp_path(self) -> Path:
+        """Return a fresh temporary file next to the blobs, for streaming a download into the store."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.blobs_dir, prefix='.download_')
+        os.close(fd)
+        return Path(tmp_path)
+
+    def put_file(self, prompt_key: str, tmp_path: Path, digest: str, prompt: str) -> str:
+        """Move an already written and hashed file into the store and return its digest."""
+        blob_path = self.blob_path(digest)
+        if blob_path.exists():
+            logger.debug(f"Image bytes already stored as blob {digest}")
+            tmp_path.unlink()
+        else:
+            os.replace(tmp_path, blob_path)
+        self.link(prompt_key, digest, prompt)
+        return digest
+
+    def link(self, prompt_key: str, digest: str, prompt: str) -> None:
+        """Point prompt_key at a stored blob, e.g. a near-duplicate of the image it generated."""
+        index_entry = json.dumps({'blob': digest, 'prompt': prompt})
+        atomic_write(self.prompts_dir / f"{prompt_key}.json", index_entry.encode('utf-8'))
+
+    def discard(self, digest: str) -> None:
+        """Delete a blob and its derivatives; only for blobs no run refers to."""
+        for path in [self.blob_path(digest), *self.variants_dir.glob(f"{digest}_*")]:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+        logger.debug(f"Discarded blob {digest}")
+
+    def resolve_run(self, run_id: str) -> Dict[int, Path]:
+        """Return the image path of every step of a run recorded before the run index existed."""
+        try:
+            with open(self.runs_dir / f"{run_id}.json", 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            logger.warning(f"No images recorded for run: {run_id}")
+            return {}
+        return {int(step_number): self.blob_path(digest) for step_number, digest in entry.items()}
+
+_image_store: Optional[ImageStore] = None
+_image_store_lock = threading.Lock()
+
+def get_image_store() -> ImageStore:
+    """Return the process-wide image store."""
+    global _image_store
+    with _image_store_lock:
+        if _image_store is None:
+            _image_store = ImageStore(ConfigManager().get('image_store.dir'))
+    return _image_store
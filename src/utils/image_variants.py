@@ -0,0 +1,160 @@
+import io
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from cachetools import LRUCache
+from config.config_manager import ConfigManager
+from utils.cache_helpers import atomic_write
+from utils.image_store import get_image_store
+from utils.metrics_helpers import metrics
+
+logger = logging.getLogger(__name__)
+
+_FORMATS = {'webp': ('WEBP', 'webp'), 'jpeg': ('JPEG', 'jpg')}
+
+_variant_cache: Optional[LRUCache] = None
+_variant_cache_lock = threading.Lock()
+_variant_cache_hits = 0
+_variant_cache_misses = 0
+
+def _format() -> tuple:
+    return _FORMATS[ConfigManager().get('image_variants.format')]
+
+def variant_width(target_px: int) -> int:
+    """Return the smallest configured variant width that fills target_px, or the largest one."""
+    widths = sorted(ConfigManager().get('image_variants.widths'))
+    return next((width for width in widths if width >= target_px), widths[-1])
+
+# Side of the difference hash grid: 16x16 brightness comparisons per color channel give a 768-bit hash
+DHASH_SIZE = 16
+
+def dhash(image) -> int:
+    """Return the color difference hash of a PIL RGB image.
+
+    For each of the red, green and blue channels, a 17x16 thumbnail records
+    whether brightness falls from each pixel to its right neighbour. Re-encoded
+    copies of a picture hash alike, while pictures that differ only in color do not.
+    """
+    from PIL import Image
+
+    small = image.convert('RGB').resize((DHASH_SIZE + 1, DHASH_SIZE), Image.LANCZOS)
+    value = 0
+    for band in small.split():
+        pixels = list(band.getdata())
+        for row in range(DHASH_SIZE):
+            for col in range(DHASH_SIZE):
+                left = pixels[row * (DHASH_SIZE + 1) + col]
+                value = value << 1 | (left > pixels[row * (DHASH_SIZE + 1) + col + 1])
+    return value
+
+def render_derivatives(blob_path: str, outputs: List[Tuple[str, int, str, int]]) -> int:
+    """Decode a stored image once, write its derivatives and return its difference hash.
+
+    Each output is (path, max_px, PIL format, quality). Derivatives are encoded
+    from the pixels alone, so no metadata of the original is carried over. Runs
+    in the post-processing worker processes, hence the plain arguments.
+    """
+    from PIL import Image
+
+    with Image.open(blob_path) as source:
+        source = source.convert('RGB')
+    source.info = {}
+    for path, max_px, pil_format, quality in sorted(outputs, key=lambda output: output[1], reverse=True):
+        image = source.copy()
+        image.thumbnail((max_px, max_px))
+        buffer = io.BytesIO()
+        image.save(buffer, format=pil_format, quality=quality, optimize=True)
+        atomic_write(Path(path), buffer.getvalue())
+    return dhash(source)
+
+def _variant_outputs(digest: str, widths: List[int]) -> Dict[int, Tuple[str, int, str, int]]:
+    config = ConfigManager()
+    store = get_image_store()
+    pil_format, extension = _format()
+    return {
+        width: (str(store.variant_path(digest, width, extension)), width, pil_format, config.get('image_variants.quality'))
+        for width in widths
+    }
+
+def _document_output(digest: str) -> Tuple[str, int, str, int]:
+    config = ConfigManager()
+    max_px = config.get('document.image_max_px')
+    return (str(get_image_store().document_image_path(digest, max_px)), max_px, 'JPEG', config.get('document.image_quality'))
+
+def derivative_outputs(digest: str) -> List[Tuple[str, int, str, int]]:
+    """Return the display variants and document copy of a stored image that don't exist yet."""
+    outputs = [*_variant_outputs(digest, ConfigManager().get('image_variants.widths')).values(), _document_output(digest)]
+    return [output for output in outputs if not Path(output[0]).exists()]
+
+def make_variants(digest: str, widths: Optional[List[int]] = None) -> Dict[int, Path]:
+    """Write the downscaled display copies of a stored image that don't exist yet.
+
+    New images get them from post-processing; this covers images stored before it.
+    """
+    outputs = _variant_outputs(digest, widths or ConfigManager().get('image_variants.widths'))
+    missing = [output for output in outputs.values() if not Path(output[0]).exists()]
+    if missing:
+        render_derivatives(str(get_image_store().blob_path(digest)), missing)
+        logger.debug(f"Made {len(missing)} display variant(s) of blob {digest}")
+    return {width: Path(output[0]) for width, output in outputs.items()}
+
+def get_document_image(image_path: Path) -> bytes:
+    """Return the downscaled JPEG copy of a stored image that documents embed, making it if needed."""
+    digest = Path(image_path).stem
+    output = _document_output(digest)
+    path = Path(output[0])
+    if not path.exists():
+        render_derivatives(str(get_image_store().blob_path(digest)), [output])
+    return path.read_bytes()
+
+def _get_cache() -> LRUCache:
+    global _variant_cache
+    with _variant_cache_lock:
+        if _variant_cache is None:
+            _variant_cache = LRUCache(maxsize=ConfigManager().get('image_variants.cache_max_bytes'), getsizeof=len)
+        return _variant_cache
+
+def get_image_variant(image_path: Path, target_px: int) -> bytes:
+    """Return the encoded bytes of the smallest variant of a stored image that fits target_px.
+
+    Variants are made on first use and kept in a memory-budgeted LRU cache shared
+    by all sessions, so a rerun neither decodes the full-size PNG nor sends it to
+    the browser.
+    """
+    global _variant_cache_hits, _variant_cache_misses
+    digest = Path(image_path).stem
+    width = variant_width(target_px)
+    key = (digest, width, ConfigManager().get('image_variants.format'))
+
+    cache = _get_cache()
+    with _variant_cache_lock:
+        data = cache.get(key)
+        if data is not None:
+            _variant_cache_hits += 1
+            return data
+        _variant_cache_misses += 1
+
+    path = make_variants(digest, [width])[width]
+    data = path.read_bytes()
+    with _variant_cache_lock:
+        if len(data) <= cache.maxsize:
+            cache[key] = data
+    return data
+
+def get_variant_cache_stats() -> Dict:
+    """Return hit/miss counts and the memory used by the variant cache."""
+    cache = _get_cache()
+    with _variant_cache_lock:
+        return {
+            'hits': _variant_cache_hits,
+            'misses': _variant_cache_misses,
+            'entries': len(cache),
+            'bytes': cache.currsize,
+            'max_bytes': cache.maxsize,
+        }
+
+metrics.describe('simplifygpt_image_variant_cache', 'In-memory cache of display-size images.')
+metrics.gauge('simplifygpt_image_variant_cache', lambda: {
+    (('kind', kind),): value for kind, value in get_variant_cache_stats().items()
+})
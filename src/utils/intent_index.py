@@ -0,0 +1,228 @@
+import logging
+import math
+import re
+from collections import Counter
+import threading
+import time
+from typing import Dict, FrozenSet, List, Optional, Tuple
+from config.config_manager import ConfigManager
+from utils.cache_helpers import normalize_intent
+from utils.metrics_helpers import metrics
+
+logger = logging.getLogger(__name__)
+
+# Question phrasing that can lead an intent without changing the concept, longest first.
+# Some also close it ("how does X work", "what does X mean"); the closing words are
+# only dropped together with their opening phrase.
+QUESTION_PHRASES = (
+    (('can', 'you', 'explain'), ()),
+    (('please', 'explain'), ()),
+    (('tell', 'me', 'about'), ()),
+    (('how', 'does'), ('work', 'works')),
+    (('how', 'do'), ('work',)),
+    (('what', 'does'), ('mean',)),
+    (('what', 'do'), ('mean',)),
+    (('what', 's'), ()),
+    (('what', 'is'), ()),
+    (('what', 'are'), ()),
+    (('why', 'is'), ()),
+    (('how', 'is'), ()),
+    (('whats',), ()),
+    (('explain',), ()),
+    (('define',), ()),
+)
+
+# Trailing words that only address the reader ("explain X to me")
+TRAILING_PHRASES = (('in', 'simple', 'terms'), ('to', 'me'), ('for', 'me'), ('please',))
+
+ARTICLES = frozenset({'a', 'an', 'the'})
+
+# Symbols that are part of a concept's name ("C++", "C#", "A*", ".NET", "TCP/IP"); other punctuation is dropped
+CONCEPT_SYMBOLS = '+#*./'
+
+metrics.describe('simplifygpt_similar_intent_lookups_total', 'Lookups of past runs with a similar intent, by result.')
+
+def _strip_question(words: List[str]) -> List[str]:
+    for opening, closing in QUESTION_PHRASES:
+        if tuple(words[:len(opening)]) == opening:
+            words = words[len(opening):]
+            if words and words[-1] in closing:
+                words = words[:-1]
+            break
+    if words and words[0] in ARTICLES:
+        words = words[1:]
+    for trailing in TRAILING_PHRASES:
+        if len(words) > len(trailing) and tuple(words[-len(trailing):]) == trailing:
+            words = words[:-len(trailing)]
+            break
+    return words
+
+def _singular(word: str) -> str:
+    """Crudely singularize a word ("bonds" -> "bond"); the same rule applies to every intent, so it needs no exceptions list."""
+    if len(word) <= 3 or not word.endswith('s') or word.endswith(('ss', 'us', 'is')) or _has_symbol(word):
+        return word
+    if word.endswith('ies'):
+        return word[:-3] + 'y'
+    if word.endswith(('ses', 'xes', 'zes', 'ches', 'shes')):
+        return word[:-2]
+    return word[:-1]
+
+def _has_symbol(word: str) -> bool:
+    return any(symbol in word for symbol in CONCEPT_SYMBOLS)
+
+def match_key(user_intent: str) -> str:
+    """Normalize an intent for similarity matching: case, punctuation, hyphens, spacing, question phrasing and plurals.
+
+    Symbols in CONCEPT_SYMBOLS are kept, except a sentence-ending period.
+    """
+    text = re.sub(r'[^\w\s+#*./]', ' ', normalize_intent(user_intent)).replace('_', ' ')
+    words = [word.rstrip('.') for word in text.split()]
+    words = [word for word in words if word]
+    kept = _strip_question(words) or words
+    return ' '.join(_singular(word) for word in kept)
+
+def symbol_words(key: str) -> Tuple[str, ...]:
+    """Return the sorted words of a match key that contain a concept symbol ("c++", ".net")."""
+    return tuple(sorted(word for word in key.split() if _has_symbol(word)))
+
+def char_ngrams(text: str, n: int = 3) -> FrozenSet[str]:
+    """Return the set of character n-grams of a string, ignoring spaces so "photo synthesis" matches "photosynthesis"."""
+    padded = f" {text.replace(' ', '')} "
+    return frozenset(padded[i:i + n] for i in range(max(len(padded) - n + 1, 1)))
+
+class IntentIndex:
+    """In-memory inverted index of past intents over character trigrams.
+
+    Similarity is the Jaccard index of the trigram sets of the match keys, which
+    tolerates typos and spacing. A match above the threshold must contain at
+    least one of the query's rarest trigrams (prefix filtering). A query therefore
+    counts hits only in the posting lists of its few rarest trigrams, and computes
+    the exact score only for intents with enough hits there. Trigrams are
+    interned as integer ids shared by the posting lists, so memory stays small.
+    """
+
+    # Rare trigrams probed beyond the minimum prefix; a candidate must hit PROBE_EXTRA + 1 of them
+    PROBE_EXTRA = 3
+
+    def __init__(self, n: int = 3):
+        self.n = n
+        self._lock = threading.Lock()
+        self._gram_ids: Dict[str, int] = {}
+        self._postings: List[List[int]] = []
+        self._ids: Dict[str, int] = {}
+        self._grams: List[Tuple[int, ...]] = []
+        self._intents: List[str] = []
+        self._run_ids: List[str] = []
+        self._symbols: List[Tuple[str, ...]] = []
+
+    def __len__(self) -> int:
+        return len(self._grams)
+
+    def add(self, user_intent: str, run_id: str) -> None:
+        """Index an intent's run; a newer run for the same intent replaces the older one."""
+        key = match_key(user_intent)
+        with self._lock:
+            entry_id = self._ids.get(key)
+            if entry_id is not None:
+                self._intents[entry_id] = user_intent
+                self._run_ids[entry_id] = run_id
+                return
+            entry_id = len(self._grams)
+            gram_ids = []
+            for gram in char_ngrams(key, self.n):
+                gram_id = self._gram_ids.setdefault(gram, len(self._gram_ids))
+                if gram_id == len(self._postings):
+                    self._postings.append([])
+                self._postings[gram_id].append(entry_id)
+                gram_ids.append(gram_id)
+            self._ids[key] = entry_id
+            self._grams.append(tuple(gram_ids))
+            self._intents.append(user_intent)
+            self._run_ids.append(run_id)
+            self._symbols.append(symbol_words(key))
+
+    def search(self, user_intent: str, threshold: float, limit: int = 1) -> List[Dict]:
+        """Return up to limit indexed runs whose intent scores at least threshold, best first.
+
+        A match must also have the same symbol words, so "C templates" never matches "C++ templates".
+        """
+        key = match_key(user_intent)
+        symbols = symbol_words(key)
+        grams = char_ngrams(key, self.n)
+        size = len(grams)
+        need = max(math.ceil(threshold * size), 1)
+        matches = []
+        with self._lock:
+            known = [self._gram_ids[gram] for gram in grams if gram in self._gram_ids]
+            # A match shares at least `need` trigrams, so it misses at most size - need of them
+            if len(known) < need:
+                return []
+            known.sort(key=lambda gram_id: len(self._postings[gram_id]))
+            probe = known[:len(known) - need + 1 + self.PROBE_EXTRA]
+            min_hits = need - (len(known) - len(probe))
+
+            hits = Counter()
+            for gram_id in probe:
+                hits.update(self._postings[gram_id])
+
+            query = set(known)
+            low, high = threshold * size, size / threshold
+            candidates = [entry_id for entry_id, count in hits.items() if count >= min_hits]
+            for entry_id in candidates:
+                other = self._grams[entry_id]
+                # Jaccard can't exceed the ratio of the set sizes
+                if not low <= len(other) <= high or self._symbols[entry_id] != symbols:
+                    continue
+                shared = len(query.intersection(other))
+                score = shared / (size + len(other) - shared)
+                if score >= threshold:
+                    matches.append({
+                        'user_intent': self._intents[entry_id],
+                        'run_id': self._run_ids[entry_id],
+                        'score': round(score, 3),
+                    })
+        matches.sort(key=lambda match: match['score'], reverse=True)
+        return matches[:limit]
+
+_intent_index: Optional[IntentIndex] = None
+_intent_index_lock = threading.Lock()
+_synced_until = 0.0
+_synced_at = 0.0
+
+def get_intent_index() -> IntentIndex:
+    """Return the process-wide intent index, catching up with runs finished since the last sync.
+
+    Runs are read from the run index, so runs finished by other processes (e.g.
+    workers) are picked up within dedup.refresh_interval seconds.
+    """
+    global _intent_index, _synced_until, _synced_at
+    from utils.run_index import get_run_index
+
+    with _intent_index_lock:
+        if _intent_index is None:
+            _intent_index = IntentIndex()
+        now = time.monotonic()
+        if _synced_at and now - _synced_at < ConfigManager().get('dedup.refresh_interval'):
+            return _intent_index
+        _synced_at = now
+        start_time = time.perf_counter()
+        runs = get_run_index().runs_updated_since(_synced_until, status='ok')
+        for run in runs:
+            _intent_index.add(run['user_intent'], run['run_id'])
+            _synced_until = max(_synced_until, run['updated_at'])
+        if runs:
+            logger.debug(f"Indexed {len(runs)} run(s) for similarity in {(time.perf_counter() - start_time) * 1000:.1f} ms")
+        return _intent_index
+
+def find_similar_run(user_intent: str) -> Optional[Dict]:
+    """Return the past run whose intent is most similar to this one, if it scores above dedup.threshold."""
+    config = ConfigManager()
+    if config.get('dedup.mode') == 'off':
+        return None
+    matches = get_intent_index().search(user_intent, config.get('dedup.threshold'))
+    metrics.inc('simplifygpt_similar_intent_lookups_total', result='hit' if matches else 'miss')
+    if not matches:
+        return None
+    logger.info(f"'{user_intent}' matches past run {matches[0]['run_id']} for '{matches[0]['user_intent']}' "
+                f"(score {matches[0]['score']})")
+    return matches[0]
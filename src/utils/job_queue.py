@@ -0,0 +1,191 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from config.config_manager import ConfigManager
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_until REAL,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_queued ON jobs (status, priority, created_at);
+"""
+
+FINISHED_STATUSES = ('done', 'failed')
+
+class JobTimeout(TimeoutError):
+    pass
+
+class JobQueue:
+    """Persistent job queue in a SQLite file shared by the UI, the CLI and worker processes.
+
+    Jobs survive restarts: a worker holds a job under a lease that it renews while
+    the job runs, and a job whose lease expired (e.g. its worker was killed) is
+    handed to the next worker that asks, up to max_attempts times.
+    """
+
+    def __init__(self, db_path: str, lease_seconds: float = 60, max_attempts: int = 3):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def submit(self, kind: str, payload: Dict, priority: int = 0) -> str:
+        """Queue a job and return its id; lower priority values are claimed first."""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, kind, payload, status, priority, created_at) VALUES (?, ?, ?, 'queued', ?, ?)",
+                (job_id, kind, json.dumps(payload, ensure_ascii=False), priority, time.time()),
+            )
+        logger.info(f"Submitted {kind} job {job_id}")
+        return job_id
+
+    def claim(self, worker: str, kinds: Optional[List[str]] = None) -> Optional[Dict]:
+        """Take the next queued (or abandoned) job for a worker, or return None if there is none."""
+        now = time.time()
+        query = (
+            "SELECT job_id FROM jobs WHERE (status = 'queued' OR (status = 'running' AND lease_until < ?))"
+        )
+        params: list = [now]
+        if kinds:
+            query += f" AND kind IN ({', '.join('?' for _ in kinds)})"
+            params.extend(kinds)
+        query += " ORDER BY priority, created_at LIMIT 1"
+
+        with self._lock:
+            # BEGIN IMMEDIATE takes the write lock up front, so two workers never claim the same job
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'Worker stopped responding', finished_at = ? "
+                    "WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                    (now, now, self.max_attempts),
+                )
+                row = self._conn.execute(query, params).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'running', worker = ?, lease_until = ?, attempts = attempts + 1, "
+                    "started_at = ? WHERE job_id = ?",
+                    (worker, now + self.lease_seconds, now, row['job_id']),
+                )
+                job = self._conn.execute("SELECT * FROM jobs WHERE job_id = ?", (row['job_id'],)).fetchone()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self._row_to_job(job)
+
+    def renew(self, job_id: str, worker: str) -> bool:
+        """Extend a running job's lease; returns False if the worker no longer holds it."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE job_id = ? AND worker = ? AND status = 'running'",
+                (time.time() + self.lease_seconds, job_id, worker),
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: str, worker: str, result: Any) -> bool:
+        """Record a job's result; returns False (and drops the result) if the worker no longer holds it."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, error = NULL, lease_until = NULL, finished_at = ? "
+                "WHERE job_id = ? AND worker = ? AND status = 'running'",
+                (json.dumps(result, ensure_ascii=False, default=str), time.time(), job_id, worker),
+            )
+        if cursor.rowcount != 1:
+            logger.warning(f"Dropped the result of job {job_id}: worker {worker} no longer holds it")
+            return False
+        return True
+
+    def fail(self, job_id: str, worker: str, error: str) -> Optional[str]:
+        """Record a failed attempt, queueing the job again while it has attempts left.
+
+        Returns the new status, or None (and drops the error) if the worker no longer holds the job.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT attempts FROM jobs WHERE job_id = ? AND worker = ? AND status = 'running'", (job_id, worker)
+            ).fetchone()
+            status = 'queued' if row is not None and row['attempts'] < self.max_attempts else 'failed'
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, lease_until = NULL, finished_at = ? "
+                "WHERE job_id = ? AND worker = ? AND status = 'running'",
+                (status, error, time.time() if status == 'failed' else None, job_id, worker),
+            )
+        if cursor.rowcount != 1:
+            logger.warning(f"Dropped the failure of job {job_id}: worker {worker} no longer holds it")
+            return None
+        return status
+
+    def _row_to_job(self, row: sqlite3.Row) -> Dict:
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'])
+        job['result'] = json.loads(job['result']) if job['result'] is not None else None
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def wait(self, job_id: str, timeout: Optional[float] = None, poll_interval: float = 0.5) -> Dict:
+        """Poll until a job is done or failed and return it; raises JobTimeout after timeout seconds."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None:
+                raise KeyError(f"Unknown job: {job_id}")
+            if job['status'] in FINISHED_STATUSES:
+                return job
+            if deadline is not None and time.monotonic() >= deadline:
+                raise JobTimeout(f"Job {job_id} still {job['status']} after {timeout}s")
+            time.sleep(poll_interval)
+
+    def stats(self) -> Dict[str, int]:
+        """Return the number of jobs in each status."""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, count(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row['status']: row['n'] for row in rows}
+
+_job_queue: Optional[JobQueue] = None
+_job_queue_lock = threading.Lock()
+
+def get_job_queue() -> JobQueue:
+    """Return the process-wide job queue."""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            config = ConfigManager()
+            _job_queue = JobQueue(
+                config.get('jobs.path'),
+                lease_seconds=config.get('jobs.lease_seconds'),
+                max_attempts=config.get('jobs.max_attempts'),
+            )
+    return _job_queue
@@ -0,0 +1,177 @@
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Deque, Dict, List, Optional, Tuple
+from config.config_manager import ConfigManager
+from utils.metrics_helpers import add_span_listener, metrics
+
+logger = logging.getLogger(__name__)
+
+# Spans whose outcome counts towards the error rate: the OpenAI calls
+API_STAGES = ('completion', 'image_generate')
+
+# Fewer samples than this in the window are too few to estimate p95 latency or the error rate
+MIN_SAMPLES = 5
+
+# Service tier of the current request; child tasks inherit it (None means the full tier)
+service_tier: contextvars.ContextVar[Optional[Dict]] = contextvars.ContextVar('service_tier', default=None)
+
+metrics.describe('simplifygpt_service_tier', 'Service tier new requests are generated at (0 is the full tier).')
+metrics.describe('simplifygpt_tier_changes_total', 'Load-shedding tier changes, by the tier entered.')
+
+def tier_settings(level: int) -> Dict:
+    """Return the settings of a load-shedding tier.
+
+    Level 0 is the configured service. Each level of load_shedding.tiers applies
+    its overrides (model, max_tokens, max_steps, images) on top of the level below.
+    """
+    config = ConfigManager()
+    settings = {
+        'level': 0,
+        'name': 'full',
+        'model': config.get('openai.model'),
+        'max_tokens': config.get('chat.max_tokens'),
+        'max_steps': None,
+        'images': 'generate',
+    }
+    for number, tier in enumerate(config.get('load_shedding.tiers')[:level], start=1):
+        settings.update({key: value for key, value in tier.items() if key != 'enter'}, level=number)
+    return settings
+
+def get_service_tier() -> Dict:
+    """Return the tier of the current request; requests started outside the pipeline get the full tier."""
+    return service_tier.get() or tier_settings(0)
+
+async def with_tier(tier: Optional[Dict], coro: Awaitable[Any]) -> Any:
+    """Await a coroutine with the given service tier applied to everything it generates."""
+    service_tier.set(tier)
+    return await coro
+
+class LoadPolicy:
+    """Picks the service tier of new requests from recent load, with hysteresis.
+
+    The signals are the queue depth (generations in flight in this process plus,
+    in queue mode, jobs waiting in the job queue), the p95 pipeline latency and the
+    API error rate over the last window_seconds. A tier is entered as soon as any
+    signal reaches one of its thresholds, skipping tiers if needed. It is left one
+    tier at a time, only after hold_seconds in it and once every signal is below
+    recover_ratio of the thresholds that entered it, so the tier doesn't flap.
+    """
+
+    def __init__(self, window_seconds: float, evaluate_interval: float, hold_seconds: float,
+                 recover_ratio: float, thresholds: List[Dict[str, float]]):
+        self.window_seconds = window_seconds
+        self.evaluate_interval = evaluate_interval
+        self.hold_seconds = hold_seconds
+        self.recover_ratio = recover_ratio
+        # thresholds[level - 1] holds the signal values that enter that level
+        self.thresholds = thresholds
+        self.level = 0
+        self._lock = threading.Lock()
+        self._changed_at = time.monotonic()
+        self._evaluated_at = 0.0
+        self._latencies: Deque[Tuple[float, float]] = deque()
+        self._api_calls: Deque[Tuple[float, bool]] = deque()
+
+    def observe(self, stage: str, duration: float, status: str) -> None:
+        """Record a finished span: pipeline latencies and API call outcomes feed the signals."""
+        now = time.monotonic()
+        with self._lock:
+            if stage == 'pipeline' and status == 'ok':
+                self._latencies.append((now, duration))
+            elif stage in API_STAGES:
+                self._api_calls.append((now, status == 'error'))
+
+    def _trim(self, now: float) -> None:
+        cutoff = now - self.window_seconds
+        for samples in (self._latencies, self._api_calls):
+            while samples and samples[0][0] < cutoff:
+                samples.popleft()
+
+    def _queue_depth(self) -> int:
+        # Imported here: the pipeline imports this module
+        from utils.pipeline_helpers import get_coalescing_stats
+
+        depth = get_coalescing_stats()['in_flight']
+        if ConfigManager().get('jobs.mode') == 'queue':
+            from utils.job_queue import get_job_queue
+            depth += get_job_queue().stats().get('queued', 0)
+        return depth
+
+    def signals(self) -> Dict[str, float]:
+        """Return the current queue depth, p95 pipeline latency and API error rate."""
+        queue_depth = self._queue_depth()
+        with self._lock:
+            self._trim(time.monotonic())
+            latencies = sorted(duration for _, duration in self._latencies)
+            errors = [failed for _, failed in self._api_calls]
+        return {
+            'queue_depth': queue_depth,
+            'p95_seconds': latencies[int(0.95 * (len(latencies) - 1))] if len(latencies) >= MIN_SAMPLES else 0.0,
+            'error_rate': sum(errors) / len(errors) if len(errors) >= MIN_SAMPLES else 0.0,
+        }
+
+    def _reached(self, level: int, signals: Dict[str, float], scale: float = 1.0) -> bool:
+        return any(signals[name] >= value * scale for name, value in self.thresholds[level - 1].items())
+
+    def evaluate(self) -> int:
+        """Re-evaluate the load and return the tier level new requests get."""
+        signals = self.signals()
+        now = time.monotonic()
+        with self._lock:
+            self._evaluated_at = now
+            previous = self.level
+            target = max((level for level in range(1, len(self.thresholds) + 1) if self._reached(level, signals)), default=0)
+            if target > self.level:
+                self.level = target
+            elif (self.level > 0 and now - self._changed_at >= self.hold_seconds
+                  and not self._reached(self.level, signals, self.recover_ratio)):
+                self.level -= 1
+            if self.level != previous:
+                self._changed_at = now
+            level = self.level
+        if level != previous:
+            name = tier_settings(level)['name']
+            metrics.inc('simplifygpt_tier_changes_total', tier=name)
+            log = logger.warning if level > previous else logger.info
+            log(f"Load-shedding tier {previous} -> {level} ({name}); signals: {signals}")
+        return level
+
+    def current_tier(self) -> Dict:
+        """Return the settings of the tier for a new request, re-evaluating the load at most every evaluate_interval."""
+        if not ConfigManager().get('load_shedding.enabled'):
+            return tier_settings(0)
+        if time.monotonic() - self._evaluated_at >= self.evaluate_interval:
+            self.evaluate()
+        return tier_settings(self.level)
+
+    def stats(self) -> Dict:
+        """Return the current level and signals."""
+        return {'level': self.level, **self.signals()}
+
+_load_policy: Optional[LoadPolicy] = None
+_load_policy_lock = threading.Lock()
+
+def get_load_policy() -> LoadPolicy:
+    """Return the process-wide load policy."""
+    global _load_policy
+    with _load_policy_lock:
+        if _load_policy is None:
+            config = ConfigManager()
+            _load_policy = LoadPolicy(
+                window_seconds=config.get('load_shedding.window_seconds'),
+                evaluate_interval=config.get('load_shedding.evaluate_interval'),
+                hold_seconds=config.get('load_shedding.hold_seconds'),
+                recover_ratio=config.get('load_shedding.recover_ratio'),
+                thresholds=[tier['enter'] for tier in config.get('load_shedding.tiers')],
+            )
+    return _load_policy
+
+def _record_span(stage: str, trace_id: Optional[str], duration: float, status: str) -> None:
+    if stage == 'pipeline' or stage in API_STAGES:
+        get_load_policy().observe(stage, duration, status)
+
+add_span_listener(_record_span)
+metrics.gauge('simplifygpt_service_tier', lambda: {(): get_load_policy().level})
@@ -1,58 +1,115 @@
+import atexit
 import logging
-import sys
+import logging.handlers
 import os
-from datetime import datetime
+import queue
+import random
+import sys
+import threading
 from pathlib import Path
+from config.config_manager import ConfigManager
+
+_listener = None
+_setup_lock = threading.Lock()
+
+class DebugSampler(logging.Filter):
+    """Keep only a fraction of DEBUG records; higher levels always pass."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or self.rate >= 1 or random.random() < self.rate
 
-def setup_logging():
-    """Configure logging to output to timestamped file in output directory."""
-    # Remove any existing handlers first
+def _rotating_handler(path: Path, config: ConfigManager) -> logging.Handler:
+    if config.get('logging.rotation') == 'time':
+        return logging.handlers.TimedRotatingFileHandler(
+            path,
+            when=config.get('logging.when'),
+            backupCount=config.get('logging.backup_count'),
+            encoding='utf-8',
+        )
+    return logging.handlers.RotatingFileHandler(
+        path,
+        maxBytes=config.get('logging.max_bytes'),
+        backupCount=config.get('logging.backup_count'),
+        encoding='utf-8',
+    )
+
+def setup_logging(role: str = 'app'):
+    """Configure process-wide logging, once per process.
+
+    Records are put on an in-memory queue by the calling thread and written to
+    the rotating debug/error files and the console by a background listener
+    thread, so logging never blocks request or event-loop threads on I/O.
+    Repeated calls (e.g. on every Streamlit rerun) are no-ops.
+
+    Each process writes its own files, named after its role (app, worker,
+    batch, ...) and pid: rotating handlers can't share a file between processes.
+    """
+    global _listener
     root_logger = logging.getLogger()
-    root_logger.handlers.clear()
-    
-    # Set the logging level
-    root_logger.setLevel(logging.DEBUG)
-    
-    # Create formatters
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    
-    # Create output directory if it doesn't exist
-    base_dir = Path(__file__).parent.parent.parent  # Go up to project root
-    logs_dir = Path(base_dir) / "logs"
-    error_logs_dir = logs_dir / "errors"  # Separate directory for error logs
-    
-    # Create directories
-    logs_dir.mkdir(parents=True, exist_ok=True)
-    error_logs_dir.mkdir(parents=True, exist_ok=True)
-    
-    # Create timestamped log files
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    debug_log_file = logs_dir / f"debug_{timestamp}.log"
-    error_log_file = error_logs_dir / f"error_{timestamp}.log"
-    
-    # Setup debug file handler (all logs)
-    file_handler = logging.FileHandler(debug_log_file)
-    file_handler.setFormatter(formatter)
-    file_handler.setLevel(logging.DEBUG)
-    
-    # Setup error file handler (only ERROR and above)
-    error_file_handler = logging.FileHandler(error_log_file)
-    error_file_handler.setFormatter(formatter)
-    error_file_handler.setLevel(logging.ERROR)
-    
-    # Setup console handler
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(formatter)
-    console_handler.setLevel(logging.DEBUG)
-    
-    # Add all handlers
-    root_logger.addHandler(file_handler)
-    root_logger.addHandler(error_file_handler)
-    root_logger.addHandler(console_handler)
-    
-    # Test log messages
+    with _setup_lock:
+        if _listener is not None:
+            return root_logger
+
+        config = ConfigManager()
+
+        # Remove any existing handlers first
+        root_logger.handlers.clear()
+
+        # Set the logging level
+        root_logger.setLevel(logging.DEBUG)
+
+        # Create formatters
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+        # Create output directory if it doesn't exist
+        base_dir = Path(__file__).parent.parent.parent  # Go up to project root
+        logs_dir = base_dir / config.get('logging.dir')
+        error_logs_dir = logs_dir / "errors"  # Separate directory for error logs
+
+        # Create directories
+        logs_dir.mkdir(parents=True, exist_ok=True)
+        error_logs_dir.mkdir(parents=True, exist_ok=True)
+
+        debug_log_file = logs_dir / f"debug-{role}-{os.getpid()}.log"
+        error_log_file = error_logs_dir / f"error-{role}-{os.getpid()}.log"
+
+        # Setup debug file handler (all logs)
+        file_handler = _rotating_handler(debug_log_file, config)
+        file_handler.setFormatter(formatter)
+        file_handler.setLevel(logging.DEBUG)
+
+        # Setup error file handler (only ERROR and above)
+        error_file_handler = _rotating_handler(error_log_file, config)
+        error_file_handler.setFormatter(formatter)
+        error_file_handler.setLevel(logging.ERROR)
+
+        # Setup console handler
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(formatter)
+        console_handler.setLevel(config.get('logging.console_level'))
+
+        # Writers run on the listener thread; callers only enqueue
+        log_queue = queue.SimpleQueue()
+        queue_handler = logging.handlers.QueueHandler(log_queue)
+        queue_handler.addFilter(DebugSampler(config.get('logging.debug_sample_rate')))
+        root_logger.addHandler(queue_handler)
+
+        _listener = logging.handlers.QueueListener(
+            log_queue, file_handler, error_file_handler, console_handler, respect_handler_level=True
+        )
+        _listener.start()
+        atexit.register(_listener.stop)
+
+        # Chatty HTTP client internals drown out our own DEBUG lines
+        for name in config.get('logging.quiet_loggers'):
+            logging.getLogger(name).setLevel(config.get('logging.quiet_level'))
+
     root_logger.info(f"Logging session started. Debug log: {debug_log_file}")
     root_logger.info(f"Errors will be saved to: {error_log_file}")
     root_logger.debug("Debug logging is enabled")
-    
-    return root_logger
\ No newline at end of file
+
+    return root_logger
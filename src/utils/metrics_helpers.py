@@ -0,0 +1,229 @@
+import atexit
+import bisect
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from config.config_manager import ConfigManager
+from utils.cache_helpers import atomic_write
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 60.0, 120.0)
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+def _labels(labels: Dict) -> LabelSet:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _format_labels(labels: LabelSet, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}'
+
+class Histogram:
+    """Cumulative-bucket latency histogram in the Prometheus style."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile as the upper bound of the bucket that contains it."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return float('inf')
+
+class MetricsRegistry:
+    """In-process counters, histograms and callback gauges, rendered as Prometheus text."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelSet, float]] = {}
+        self._histograms: Dict[str, Dict[LabelSet, Histogram]] = {}
+        self._gauges: Dict[str, Callable[[], Dict[LabelSet, float]]] = {}
+        self._help: Dict[str, str] = {}
+
+    def describe(self, name: str, help_text: str) -> None:
+        self._help[name] = help_text
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            key = _labels(labels)
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            key = _labels(labels)
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+
+    def gauge(self, name: str, collect: Callable[[], Dict[LabelSet, float]]) -> None:
+        """Register a gauge whose values are collected when metrics are rendered."""
+        self._gauges[name] = collect
+
+    def quantile(self, name: str, q: float, **labels) -> float:
+        with self._lock:
+            histogram = self._histograms.get(name, {}).get(_labels(labels))
+            return histogram.quantile(q) if histogram else 0.0
+
+    def counter_value(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(_labels(labels), 0)
+
+    def render(self) -> str:
+        lines: List[str] = []
+
+        def header(name: str, kind: str) -> None:
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                header(name, 'counter')
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(labels)} {value:g}")
+            for name, series in sorted(self._histograms.items()):
+                header(name, 'histogram')
+                for labels, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                        cumulative += count
+                        le = '+Inf' if bound == float('inf') else f"{bound:g}"
+                        lines.append(f"{name}_bucket{_format_labels(labels, ('le', le))} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum:.6f}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+
+        for name, collect in sorted(self._gauges.items()):
+            try:
+                values = collect()
+            except Exception as e:
+                logger.debug(f"Gauge {name} failed to collect: {e}")
+                continue
+            header(name, 'gauge')
+            for labels, value in sorted(values.items()):
+                lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        return '\n'.join(lines) + '\n'
+
+metrics = MetricsRegistry()
+metrics.describe('simplifygpt_stage_seconds', 'Latency of pipeline stages in seconds.')
+metrics.describe('simplifygpt_stage_failures_total', 'Pipeline stages that raised an error.')
+metrics.describe('simplifygpt_tokens_total', 'Tokens used by chat completions.')
+
+_span_listeners: List[Callable[[str, Optional[str], float, str], None]] = []
+
+def add_span_listener(listener: Callable[[str, Optional[str], float, str], None]) -> None:
+    """Call listener(stage, trace_id, duration, status) whenever a span ends."""
+    _span_listeners.append(listener)
+
+@contextmanager
+def span(stage: str, trace_id: Optional[str] = None, **labels) -> Iterator[None]:
+    """Time a pipeline stage, recording its latency and any failure.
+
+    The trace_id (usually the run id) is only written to the span log, never used
+    as a metric label, to keep metric cardinality bounded.
+    """
+    start = time.perf_counter()
+    status = 'ok'
+    try:
+        yield
+    except BaseException:
+        status = 'error'
+        metrics.inc('simplifygpt_stage_failures_total', stage=stage, **labels)
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        metrics.observe('simplifygpt_stage_seconds', duration, stage=stage, **labels)
+        logger.debug("span " + json.dumps({
+            'stage': stage,
+            'trace_id': trace_id,
+            'duration': round(duration, 4),
+            'status': status,
+            **labels,
+        }))
+        for listener in _span_listeners:
+            try:
+                listener(stage, trace_id, duration, status)
+            except Exception as e:
+                logger.debug(f"Span listener failed: {e}")
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip('/') != '/metrics':
+            self.send_error(404)
+            return
+        body = metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def export_metrics(path: Optional[str] = None) -> None:
+    """Write the current metrics to a Prometheus text file."""
+    path = path or ConfigManager().get('metrics.export_path')
+    if path:
+        atomic_write(Path(path), metrics.render().encode('utf-8'))
+
+def _export_periodically(interval: float) -> None:
+    while True:
+        time.sleep(interval)
+        try:
+            export_metrics()
+        except Exception as e:
+            logger.debug(f"Metrics export failed: {e}")
+
+_started = False
+_start_lock = threading.Lock()
+
+def start_metrics() -> None:
+    """Start the /metrics endpoint and periodic file export, once per process."""
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+
+    config = ConfigManager()
+    if not config.get('metrics.enabled'):
+        return
+
+    port = config.get('metrics.port')
+    if port:
+        try:
+            server = ThreadingHTTPServer(('127.0.0.1', port), _MetricsHandler)
+            threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+            logger.info(f"Serving metrics on http://127.0.0.1:{port}/metrics")
+        except OSError as e:
+            # Another process (e.g. a second Streamlit replica) already owns the port
+            logger.warning(f"Metrics endpoint not started on port {port}: {e}")
+
+    if config.get('metrics.export_path'):
+        interval = config.get('metrics.export_interval')
+        threading.Thread(target=_export_periodically, args=(interval,), name="metrics-export", daemon=True).start()
+        atexit.register(export_metrics)
@@ -1,30 +1,205 @@
-from openai import OpenAI
 from config.config_manager import ConfigManager
+from utils.cache_helpers import CompletionCache, get_completion_cache, hash_text
+from utils.client_helpers import get_async_client, run_async
+from utils.load_policy import get_service_tier
+from utils.metrics_helpers import metrics, span
+from utils.prompt_helpers import build_messages, get_prompt_registry
+from utils.rate_limiter import call_with_limit
+from utils.schema_helpers import EXPLANATION_SCHEMA, json_schema_response_format, uses_structured_output
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
+import json
 import logging
 
 logger = logging.getLogger(__name__)
-config = ConfigManager()
-client = OpenAI(api_key=config.get('openai.api_key'))
 
 def load_system_prompt(file_path: str) -> str:
-    """Load system prompt from file."""
-    with open(file_path, 'r', encoding='utf-8') as f:
-        return f.read()
+    """Load system prompt from file, through the prompt registry."""
+    return get_prompt_registry().get(file_path).text
 
-def get_completion(user_intent: str) -> str:
-    system_prompt = load_system_prompt(config.get('openai.system_prompt_path'))
-    formatted_prompt = system_prompt.format(user_intent=user_intent)
-
-    completion = client.chat.completions.create(
-        model=config.get('openai.model'),
-        messages=[
-            {
-                "role": "system", 
-                "content": formatted_prompt
-            }
-        ],
-        temperature=config.get('chat.temperature'),
-        max_tokens=config.get('chat.max_tokens')
+def _prepare_request(user_intent: str) -> Tuple[List[Dict], List[str]]:
+    """Build the chat messages for a user intent at the current service tier, and its completion cache keys.
+
+    The first key is the one a new completion is stored under. A shed request
+    also accepts a completion cached at the full tier, which is better and free.
+    """
+    config = ConfigManager()
+    tier = get_service_tier()
+    structured = uses_structured_output()
+    messages, prompt_hash = build_messages(
+        config.get('openai.structured_system_prompt_path' if structured else 'openai.system_prompt_path'),
+        config.get('openai.user_prompt_path'),
+        user_intent,
     )
 
-    return completion.choices[0].message.content 
\ No newline at end of file
+    cache_keys = []
+    if get_completion_cache() is not None:
+        full_key = CompletionCache.make_key(
+            user_intent,
+            prompt_hash,
+            config.get('openai.model'),
+            config.get('chat.temperature'),
+            config.get('chat.max_tokens'),
+        )
+        if tier['level'] > 0:
+            cache_keys.append(CompletionCache.make_key(
+                user_intent,
+                hash_text(f"{prompt_hash}:{tier['max_steps']}"),
+                tier['model'],
+                config.get('chat.temperature'),
+                tier['max_tokens'],
+            ))
+        cache_keys.append(full_key)
+
+    if tier['max_steps']:
+        messages[-1]['content'] = messages[-1]['content'].rstrip() + f"\n\nUse at most {tier['max_steps']} steps."
+    return messages, cache_keys
+
+def _cached_completion(cache_keys: List[str]) -> Optional[str]:
+    """Return a cached completion, preferring the full tier's; only the last lookup counts as a miss."""
+    cache = get_completion_cache()
+    lookup_order = cache_keys[::-1]
+    for key in lookup_order[:-1]:
+        if cache.contains(key):
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+    return cache.get(lookup_order[-1])
+
+async def _cache_completion(cache_keys: List[str], content: str, user_intent: str, finish_reason: Optional[str]) -> None:
+    """Cache a finished completion; one cut short (max_tokens, content filter) would be served truncated."""
+    if finish_reason != 'stop':
+        logger.warning(f"Not caching the completion for '{user_intent}': finish reason {finish_reason}")
+        return
+    await asyncio.to_thread(get_completion_cache().set, cache_keys[0], content, user_intent)
+
+def is_completion_cached(user_intent: str) -> bool:
+    """Return whether a completion for this intent, prompt and model settings is in the completion cache."""
+    _, cache_keys = _prepare_request(user_intent)
+    return any(get_completion_cache().contains(key) for key in cache_keys)
+
+def _response_format_options() -> Dict:
+    """Extra request options for the configured output format."""
+    if uses_structured_output():
+        return {'response_format': json_schema_response_format('explanation', EXPLANATION_SCHEMA)}
+    return {}
+
+def _record_usage(usage) -> None:
+    """Count the tokens reported for a completion."""
+    if usage is None:
+        return
+    metrics.inc('simplifygpt_tokens_total', usage.prompt_tokens, kind='prompt')
+    metrics.inc('simplifygpt_tokens_total', usage.completion_tokens, kind='completion')
+    # Prompt tokens served from the provider's prompt cache (the static system prefix)
+    details = getattr(usage, 'prompt_tokens_details', None)
+    cached_tokens = getattr(details, 'cached_tokens', None) or 0
+    metrics.inc('simplifygpt_tokens_total', cached_tokens, kind='cached_prompt')
+    logger.debug(f"Completion usage: {usage.prompt_tokens} prompt ({cached_tokens} cached), {usage.completion_tokens} completion tokens")
+
+def _cache_stats():
+    cache = get_completion_cache()
+    if cache is None:
+        return {}
+    stats = cache.stats()
+    return {(('result', 'hit'),): stats['hits'], (('result', 'miss'),): stats['misses']}
+
+metrics.describe('simplifygpt_completion_cache_lookups', 'Completion cache lookups in this process.')
+metrics.gauge('simplifygpt_completion_cache_lookups', _cache_stats)
+
+async def get_completion_async(user_intent: str, run_id: Optional[str] = None, refresh: bool = False) -> str:
+    """Get the full completion for a user intent; with refresh, a cached completion is replaced."""
+    config = ConfigManager()
+    tier = get_service_tier()
+    messages, cache_keys = _prepare_request(user_intent)
+    if cache_keys and not refresh:
+        cached = _cached_completion(cache_keys)
+        if cached is not None:
+            return cached
+
+    with span('completion', trace_id=run_id, mode='full'):
+        completion = await call_with_limit(
+            'chat',
+            get_async_client().chat.completions.create,
+            model=tier['model'],
+            messages=messages,
+            temperature=config.get('chat.temperature'),
+            max_tokens=tier['max_tokens'],
+            **_response_format_options()
+        )
+    _record_usage(completion.usage)
+
+    content = completion.choices[0].message.content
+    if cache_keys:
+        await _cache_completion(cache_keys, content, user_intent, completion.choices[0].finish_reason)
+    return content
+
+def get_completion(user_intent: str) -> str:
+    return run_async(get_completion_async(user_intent))
+
+async def stream_completion(user_intent: str, run_id: Optional[str] = None, refresh: bool = False) -> AsyncIterator[str]:
+    """Stream the completion text chunk by chunk as the model produces it.
+
+    A cached completion is yielded as a single chunk, unless refresh asks for a new one.
+    """
+    config = ConfigManager()
+    tier = get_service_tier()
+    messages, cache_keys = _prepare_request(user_intent)
+    if cache_keys and not refresh:
+        cached = _cached_completion(cache_keys)
+        if cached is not None:
+            yield cached
+            return
+
+    parts = []
+    finish_reason = None
+    with span('completion', trace_id=run_id, mode='stream'):
+        # The limiter slot covers opening the stream, i.e. time to first byte
+        stream = await call_with_limit(
+            'chat',
+            get_async_client().chat.completions.create,
+            model=tier['model'],
+            messages=messages,
+            temperature=config.get('chat.temperature'),
+            max_tokens=tier['max_tokens'],
+            stream=True,
+            stream_options={"include_usage": True},
+            **_response_format_options()
+        )
+
+        async for chunk in stream:
+            _record_usage(chunk.usage)
+            if not chunk.choices:
+                continue
+            # Only the last choice chunk carries the finish reason
+            finish_reason = chunk.choices[0].finish_reason or finish_reason
+            if chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                yield chunk.choices[0].delta.content
+
+    if cache_keys:
+        await _cache_completion(cache_keys, ''.join(parts), user_intent, finish_reason)
+
+async def get_json_completion_async(messages: List[Dict], schema_name: str, schema: Dict, run_id: Optional[str] = None) -> Dict:
+    """Get a small completion constrained to a JSON schema and return it decoded.
+
+    Without structured output the model is only asked for a JSON object, so the
+    schema is then enforced by the caller's validation.
+    """
+    config = ConfigManager()
+    if uses_structured_output():
+        response_format = json_schema_response_format(schema_name, schema)
+    else:
+        response_format = {'type': 'json_object'}
+
+    with span('completion', trace_id=run_id, mode='json'):
+        completion = await call_with_limit(
+            'chat',
+            get_async_client().chat.completions.create,
+            model=get_service_tier()['model'],
+            messages=messages,
+            temperature=config.get('chat.temperature'),
+            max_tokens=config.get('chat.repair_max_tokens'),
+            response_format=response_format
+        )
+    _record_usage(completion.usage)
+    return json.loads(completion.choices[0].message.content)
@@ -0,0 +1,177 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Optional
+from config.config_manager import ConfigManager
+from utils.cache_helpers import normalize_intent
+from utils.load_policy import get_load_policy, service_tier
+from utils.metrics_helpers import metrics, span
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into one in-flight execution.
+
+    The first caller for a key runs the function; callers arriving while it is
+    still running wait for and receive the same result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        with self._lock:
+            future = self._calls.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._calls[key] = future
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if not is_leader:
+            logger.info(f"Attached to in-flight generation for '{key}' ({self.coalesced} coalesced so far)")
+            return future.result()
+
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return future.result()
+
+    def stats(self) -> Dict:
+        """Return how many executions ran and how many requests were coalesced onto them."""
+        with self._lock:
+            return {
+                'executions': self.executions,
+                'coalesced': self.coalesced,
+                'in_flight': len(self._calls),
+            }
+
+_generation_flight = SingleFlight()
+
+metrics.describe('simplifygpt_generations', 'Pipeline executions and requests coalesced onto them.')
+metrics.gauge('simplifygpt_generations', lambda: {
+    (('kind', kind),): value for kind, value in _generation_flight.stats().items()
+})
+
+_preload_started = False
+
+def _import_pipeline() -> None:
+    import utils.document_helpers
+    import utils.image_helpers
+    from utils.image_postprocess import start_postprocess_pool
+    start_postprocess_pool()
+
+def preload_pipeline() -> None:
+    """Import the openai/pydantic/docx/PIL side of the pipeline and start the image post-processing
+    workers on a background thread, once per process.
+
+    Called after the first paint so the imports overlap with the user typing an intent.
+    """
+    global _preload_started
+    if _preload_started:
+        return
+    _preload_started = True
+    threading.Thread(target=_import_pipeline, name="pipeline-preload", daemon=True).start()
+
+_pipeline_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="pipeline")
+
+def _run_pipeline(user_intent: str, on_event: Optional[Callable[[Dict], None]] = None, refresh: bool = False) -> Dict:
+    """Run completion, parsing, images and document generation for one intent."""
+    # Imported on first use so that importing the pipeline doesn't load openai/pydantic/docx/PIL
+    from utils.document_helpers import display_explanation
+    from utils.image_helpers import fill_missing_images, generate_completion_and_images
+    from utils.run_index import get_run_index
+
+    start_time = time.time()
+    run_index = get_run_index()
+    tier = get_load_policy().current_tier()
+    if tier['level'] > 0:
+        logger.info(f"Generating '{user_intent}' at load-shedding tier {tier['level']} ({tier['name']})")
+    # Pipeline threads are pooled, so the tier is reset once this run is done
+    tier_token = service_tier.set(tier)
+    try:
+        with span('pipeline'):
+            yaml_response, parsed_response, run_id = generate_completion_and_images(user_intent, on_event, refresh)
+            try:
+                output_folder = None
+                if isinstance(parsed_response, dict):
+                    fill_missing_images(parsed_response, run_id, on_event, force=refresh)
+                    output_folder = display_explanation(parsed_response, user_intent, run_id)
+                    run_index.update_run(run_id, status='ok', title=parsed_response['title'], explanation=parsed_response)
+                else:
+                    logger.error(f"Failed to parse response: {yaml_response}")
+                    run_index.update_run(run_id, status='parse_error', error='Response could not be parsed')
+            except Exception as e:
+                run_index.update_run(run_id, status='error', error=str(e))
+                raise
+    finally:
+        service_tier.reset(tier_token)
+    
+    logger.info(f"Pipeline for '{user_intent}' finished in {time.time() - start_time:.2f}s")
+    return {
+        'user_intent': user_intent,
+        'yaml_response': yaml_response,
+        'parsed_response': parsed_response,
+        'run_id': run_id,
+        'output_folder': output_folder,
+    }
+
+def get_run_result(run_id: str, user_intent: Optional[str] = None) -> Optional[Dict]:
+    """Return a finished run from the run index in the shape of a pipeline result, or None if it has no explanation."""
+    from utils.run_index import get_run_index
+
+    run = get_run_index().get_run(run_id)
+    if run is None or not isinstance(run['explanation'], dict):
+        return None
+    return {
+        'user_intent': user_intent or run['user_intent'],
+        'yaml_response': None,
+        'parsed_response': run['explanation'],
+        'run_id': run_id,
+        'output_folder': os.path.join("output", run_id),
+        'similar_to': run['user_intent'],
+    }
+
+def generate_explanation(
+    user_intent: str,
+    on_event: Optional[Callable[[Dict], None]] = None,
+    refresh: bool = False
+) -> Dict:
+    """Generate an explanation, sharing one in-flight job between concurrent requests for the same intent.
+
+    Progress events go to on_event of the request that started the job; requests
+    coalesced onto it only receive the final result. With refresh, neither a
+    cached completion nor the stored images of its prompts are reused, and the
+    request is only coalesced with other refreshes. In dedup "serve" mode, the
+    past run of a near-duplicate intent is returned without generating anything.
+    """
+    if not refresh and ConfigManager().get('dedup.mode') == 'serve':
+        from utils.intent_index import find_similar_run
+        match = find_similar_run(user_intent)
+        result = get_run_result(match['run_id'], user_intent) if match else None
+        if result is not None:
+            return result
+    return _generation_flight.do((normalize_intent(user_intent), refresh), _run_pipeline, user_intent, on_event, refresh)
+
+def start_explanation(
+    user_intent: str,
+    on_event: Optional[Callable[[Dict], None]] = None,
+    refresh: bool = False
+) -> Future:
+    """Run generate_explanation in the background, so the caller can render progress events meanwhile."""
+    return _pipeline_executor.submit(generate_explanation, user_intent, on_event, refresh)
+
+def get_coalescing_stats() -> Dict:
+    """Return single-flight metrics for the generation pipeline."""
+    return _generation_flight.stats()
@@ -0,0 +1,85 @@
+import logging
+import os
+import string
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from utils.cache_helpers import hash_text
+
+logger = logging.getLogger(__name__)
+
+class PromptTemplate:
+    """A prompt file compiled once: its text, content hash and placeholder names."""
+
+    def __init__(self, path: Path, text: str, mtime: float):
+        self.path = path
+        self.text = text
+        self.mtime = mtime
+        self.hash = hash_text(text)
+        self.fields = frozenset(
+            field for _, field, _, _ in string.Formatter().parse(text) if field
+        )
+
+    def render(self, **values) -> str:
+        """Fill in the placeholders; a template without any is returned unchanged."""
+        if not self.fields:
+            return self.text
+        return self.text.format(**values)
+
+class PromptRegistry:
+    """Loads prompt templates once and reloads a template only when its file's mtime changes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._templates: Dict[str, PromptTemplate] = {}
+
+    def get(self, file_path: str) -> PromptTemplate:
+        path = Path(file_path)
+        mtime = os.stat(path).st_mtime
+        with self._lock:
+            template = self._templates.get(file_path)
+            if template is not None and template.mtime == mtime:
+                return template
+
+        with open(path, 'r', encoding='utf-8') as f:
+            template = PromptTemplate(path, f.read(), mtime)
+        with self._lock:
+            previous = self._templates.get(file_path)
+            self._templates[file_path] = template
+        if previous is not None:
+            logger.info(f"Reloaded prompt template: {file_path}")
+        else:
+            logger.debug(f"Loaded prompt template: {file_path} ({len(template.text)} chars)")
+        return template
+
+_prompt_registry: Optional[PromptRegistry] = None
+_prompt_registry_lock = threading.Lock()
+
+def get_prompt_registry() -> PromptRegistry:
+    """Return the process-wide prompt registry."""
+    global _prompt_registry
+    with _prompt_registry_lock:
+        if _prompt_registry is None:
+            _prompt_registry = PromptRegistry()
+    return _prompt_registry
+
+def build_messages(system_prompt_path: str, user_prompt_path: str, user_intent: str) -> Tuple[list, str]:
+    """Build the chat messages for an intent and a hash identifying the prompts used.
+
+    The system message is the static instructions and schema, identical across
+    requests, so the provider can cache it as a prompt prefix; the intent goes in
+    a separate, trailing user message. A legacy system prompt that still contains
+    a {user_intent} placeholder is filled in and sent on its own.
+    """
+    registry = get_prompt_registry()
+    system_template = registry.get(system_prompt_path)
+    if system_template.fields:
+        messages = [{"role": "system", "content": system_template.render(user_intent=user_intent)}]
+        return messages, system_template.hash
+
+    user_template = registry.get(user_prompt_path)
+    messages = [
+        {"role": "system", "content": system_template.text},
+        {"role": "user", "content": user_template.render(user_intent=user_intent)},
+    ]
+    return messages, hash_text(system_template.hash + user_template.hash)
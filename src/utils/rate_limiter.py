@@ -0,0 +1,196 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from openai import APIConnectionError, InternalServerError, RateLimitError
+from config.config_manager import ConfigManager
+from utils.metrics_helpers import metrics
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+# Priority of the API calls made by the current task; child tasks inherit it
+request_priority: contextvars.ContextVar[int] = contextvars.ContextVar('request_priority', default=PRIORITY_INTERACTIVE)
+
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, InternalServerError)
+
+class AdaptiveRateLimiter:
+    """Process-wide scheduler for one kind of API call.
+
+    Combines a token bucket (requests per minute with a small burst), an AIMD
+    concurrency limit (additive increase while calls succeed within the latency
+    target, multiplicative decrease on 429s or slow calls) and a priority queue
+    so interactive requests are admitted before background ones. It must only be
+    used from the shared event loop, which is what makes it global.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: float,
+        burst: int,
+        max_concurrency: int,
+        min_concurrency: int,
+        latency_target: float,
+    ):
+        self.name = name
+        self.rate = requests_per_minute / 60.0
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.latency_target = latency_target
+        self.limit = float(max_concurrency)
+        self.tokens = float(burst)
+        self.in_flight = 0
+        self.completed = 0
+        self.throttled = 0
+        self._updated = time.monotonic()
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _dispatch(self) -> None:
+        self._refill()
+        while self._waiters and self.in_flight < int(self.limit) and self.tokens >= 1:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self.tokens -= 1
+            self.in_flight += 1
+            future.set_result(None)
+
+        if self._waiters and self.in_flight < int(self.limit) and self._wakeup is None:
+            delay = (1 - self.tokens) / self.rate
+            self._wakeup = asyncio.get_running_loop().call_later(delay, self._on_wakeup)
+
+    def _on_wakeup(self) -> None:
+        self._wakeup = None
+        self._dispatch()
+
+    async def _acquire(self, priority: int) -> None:
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Admitted just as we were cancelled; give the slot back
+                self.in_flight -= 1
+                self._dispatch()
+            raise
+
+    def _on_success(self, latency: float) -> None:
+        self.completed += 1
+        if latency > self.latency_target:
+            self.limit = max(self.min_concurrency, self.limit * 0.9)
+        else:
+            self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+
+    def _on_throttle(self) -> None:
+        self.throttled += 1
+        self.limit = max(self.min_concurrency, self.limit / 2)
+        self.tokens = min(self.tokens, 0.0)
+        logger.warning(f"[{self.name}] Rate limited; concurrency limit now {self.limit:.1f}")
+
+    @asynccontextmanager
+    async def slot(self, priority: Optional[int] = None):
+        """Wait for admission, then hold one concurrency slot for the duration of the block."""
+        await self._acquire(request_priority.get() if priority is None else priority)
+        start_time = time.monotonic()
+        try:
+            yield
+        except RateLimitError:
+            self._on_throttle()
+            raise
+        else:
+            self._on_success(time.monotonic() - start_time)
+        finally:
+            self.in_flight -= 1
+            self._dispatch()
+
+    def stats(self) -> Dict:
+        return {
+            'concurrency_limit': round(self.limit, 2),
+            'in_flight': self.in_flight,
+            'queued': sum(1 for _, _, future in self._waiters if not future.done()),
+            'completed': self.completed,
+            'throttled': self.throttled,
+        }
+
+_limiters: Dict[str, AdaptiveRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def get_rate_limiter(name: str) -> AdaptiveRateLimiter:
+    """Return the process-wide limiter configured under rate_limits.<name>."""
+    with _limiters_lock:
+        if name not in _limiters:
+            config = ConfigManager()
+            _limiters[name] = AdaptiveRateLimiter(
+                name,
+                config.get(f'rate_limits.{name}.requests_per_minute'),
+                config.get(f'rate_limits.{name}.burst'),
+                config.get(f'rate_limits.{name}.max_concurrency'),
+                config.get(f'rate_limits.{name}.min_concurrency'),
+                config.get(f'rate_limits.{name}.latency_target'),
+            )
+    return _limiters[name]
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+async def call_with_limit(name: str, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+    """Call an OpenAI coroutine through the named limiter, retrying throttled and transient failures."""
+    config = ConfigManager()
+    limiter = get_rate_limiter(name)
+    max_retries = config.get('rate_limits.max_retries')
+    base_delay = config.get('rate_limits.retry_base_delay')
+
+    for attempt in range(max_retries + 1):
+        try:
+            async with limiter.slot():
+                return await fn(*args, **kwargs)
+        except RETRYABLE_ERRORS as e:
+            if attempt == max_retries:
+                raise
+            delay = _retry_after(e)
+            if delay is None:
+                delay = base_delay * 2 ** attempt * random.uniform(0.5, 1.5)
+            logger.warning(f"[{name}] {type(e).__name__} on attempt {attempt + 1}; retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+async def with_priority(priority: int, coro: Awaitable[Any]) -> Any:
+    """Await a coroutine with every API call it makes scheduled at the given priority."""
+    request_priority.set(priority)
+    return await coro
+
+def get_rate_limiter_stats() -> Dict[str, Dict]:
+    """Return the current state of every limiter."""
+    with _limiters_lock:
+        return {name: limiter.stats() for name, limiter in _limiters.items()}
+
+metrics.describe('simplifygpt_rate_limiter', 'State of the shared API rate limiters.')
+metrics.gauge('simplifygpt_rate_limiter', lambda: {
+    (('limiter', name), ('value', key)): value
+    for name, stats in get_rate_limiter_stats().items()
+    for key, value in stats.items()
+})
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+from utils.client_helpers import get_async_client, run_async
+from utils.document_helpers import rebuild_document
+from utils.image_helpers import ProgressCallback, generate_single_image
+from utils.image_store import get_image_store
+from utils.metrics_helpers import span
+from utils.run_index import get_run_index
+from utils.schema_helpers import repair_fields_async, validate_explanation
+
+logger = logging.getLogger(__name__)
+
+# Fields rewritten when a single step's text is regenerated; the transition is kept
+STEP_TEXT_FIELDS = ('heading', 'text', 'image_description')
+
+def _load_run(run_id: str) -> Dict:
+    run = get_run_index().get_run(run_id)
+    if run is None or not isinstance(run['explanation'], dict):
+        raise ValueError(f"No explanation recorded for run: {run_id}")
+    return run
+
+def _finished_steps(run: Dict) -> Set[int]:
+    return {step['step_number'] for step in run['steps'] if step['status'] in ('ok', 'reused') and step['blob']}
+
+def incomplete_steps(run: Dict) -> List[int]:
+    """Return the step numbers of an indexed run whose image is missing or failed."""
+    if not isinstance(run.get('explanation'), dict):
+        return []
+    done = _finished_steps(run)
+    return [step['step_number'] for step in run['explanation']['steps'] if step['step_number'] not in done]
+
+async def regenerate_images_async(
+    run_id: str,
+    step_numbers: Optional[List[int]] = None,
+    on_event: Optional[ProgressCallback] = None
+) -> Dict[int, Optional[Path]]:
+    """Generate the images of the given steps of a run, by default those missing or failed.
+
+    A given step that already has its image gets a new one rather than the
+    stored image of its prompt. Returns the new image path of every step
+    attempted (None if it failed again).
+    """
+    run = await asyncio.to_thread(_load_run, run_id)
+    targets = set(step_numbers if step_numbers is not None else incomplete_steps(run))
+    steps = [step for step in run['explanation']['steps'] if step['step_number'] in targets]
+    if not steps:
+        return {}
+    finished = _finished_steps(run)
+
+    logger.info(f"Regenerating {len(steps)} image(s) for run: {run_id}")
+    client = get_async_client()
+    run_images: Dict[int, str] = {}
+    with span('regenerate_images', trace_id=run_id):
+        await asyncio.gather(*[
+            generate_single_image(client, step, run_images, run_id, on_event, force=step['step_number'] in finished)
+            for step in steps
+        ])
+    store = get_image_store()
+    return {
+        step['step_number']: store.blob_path(run_images[step['step_number']]) if step['step_number'] in run_images else None
+        for step in steps
+    }
+
+def regenerate_images(
+    run_id: str,
+    step_numbers: Optional[List[int]] = None,
+    on_event: Optional[ProgressCallback] = None
+) -> Dict[int, Optional[Path]]:
+    """Regenerate only the missing or failed (or the given) step images of an existing run.
+
+    The run's document is rebuilt if any image changed; nothing else is regenerated.
+    """
+    results = run_async(regenerate_images_async(run_id, step_numbers, on_event))
+    if any(path is not None for path in results.values()):
+        rebuild_document(_load_run(run_id)['explanation'], run_id)
+    get_run_index().update_run(run_id)
+    return results
+
+def regenerate_step_text(run_id: str, step_number: int, on_event: Optional[ProgressCallback] = None) -> Dict:
+    """Rewrite one step's heading, text and image description, then its image, and return the new step.
+
+    Uses a single small completion for the step's fields with the rest of the
+    explanation as context, instead of rerunning the whole pipeline.
+    """
+    run = _load_run(run_id)
+    explanation = run['explanation']
+    position = next(
+        (i for i, step in enumerate(explanation['steps']) if step['step_number'] == step_number), None
+    )
+    if position is None:
+        raise ValueError(f"Run {run_id} has no step {step_number}")
+
+    for field in STEP_TEXT_FIELDS:
+        explanation['steps'][position][field] = ''
+    locs = [('steps', position, field) for field in STEP_TEXT_FIELDS]
+    with span('regenerate_step', trace_id=run_id):
+        if not run_async(repair_fields_async(explanation, locs, run['user_intent'], run_id)):
+            raise RuntimeError(f"Could not regenerate step {step_number} of run {run_id}")
+    validated, locs = validate_explanation(explanation)
+    if validated is None:
+        raise RuntimeError(f"Regenerated step {step_number} of run {run_id} is invalid")
+
+    explanation = validated.model_dump(exclude_none=True)
+    get_run_index().update_run(run_id, explanation=explanation)
+    logger.info(f"Regenerated the text of step {step_number} for run: {run_id}")
+    # The image description changed, so the step gets a new image (and the document is rebuilt)
+    regenerate_images(run_id, [step_number], on_event)
+    return explanation['steps'][position]
@@ -0,0 +1,304 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+from config.config_manager import ConfigManager
+from utils.cache_helpers import NORMALIZATION_VERSION, normalize_intent
+from utils.image_store import get_image_store
+from utils.metrics_helpers import add_span_listener
+
+logger = logging.getLogger(__name__)
+
+MAX_BUFFERED_RUNS = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    user_intent TEXT NOT NULL,
+    normalized_intent TEXT NOT NULL,
+    status TEXT NOT NULL,
+    title TEXT,
+    explanation TEXT,
+    document_path TEXT,
+    timings TEXT NOT NULL DEFAULT '{}',
+    error TEXT,
+    priority INTEGER NOT NULL DEFAULT 0,
+    tier TEXT NOT NULL DEFAULT 'full',
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_created_at ON runs (created_at);
+CREATE INDEX IF NOT EXISTS runs_normalized_intent ON runs (normalized_intent, created_at);
+CREATE INDEX IF NOT EXISTS runs_updated_at ON runs (updated_at);
+CREATE TABLE IF NOT EXISTS steps (
+    run_id TEXT NOT NULL REFERENCES runs (run_id),
+    step_number INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    blob TEXT,
+    seconds REAL,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (run_id, step_number)
+);
+CREATE INDEX IF NOT EXISTS steps_blob ON steps (blob);
+CREATE TABLE IF NOT EXISTS images (
+    digest TEXT PRIMARY KEY,
+    prompt_key TEXT,
+    dhash TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+# Columns added after the first release, added to older index files when they are opened
+_ADDED_COLUMNS = (
+    ('steps', 'attempts', "INTEGER NOT NULL DEFAULT 0"),
+    ('runs', 'priority', "INTEGER NOT NULL DEFAULT 0"),
+    ('runs', 'tier', "TEXT NOT NULL DEFAULT 'full'"),
+    ('images', 'prompt_key', "TEXT"),
+)
+
+class RunIndex:
+    """SQLite index of generated runs: intent, status, artifacts, per-step images and stage timings.
+
+    Runs are keyed by run id, so a run's images and document are found with a
+    primary-key lookup instead of scanning output folders. Stage timings from
+    spans are buffered in memory and written with the run's next update.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        for table, column, definition in _ADDED_COLUMNS:
+            columns = {row['name'] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS images_prompt_key ON images (prompt_key)")
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] < NORMALIZATION_VERSION:
+            self._renormalize_intents()
+        # Timings are only buffered for runs started in this process, and only for the most recent ones
+        self._pending_timings: "OrderedDict[str, Dict[str, float]]" = OrderedDict()
+
+    def _renormalize_intents(self) -> None:
+        # Index files written with an older normalize_intent re-key their runs once
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = self._conn.execute("SELECT run_id, user_intent FROM runs").fetchall()
+            self._conn.executemany(
+                "UPDATE runs SET normalized_intent = ? WHERE run_id = ?",
+                [(normalize_intent(row['user_intent']), row['run_id']) for row in rows],
+            )
+            self._conn.execute(f"PRAGMA user_version = {NORMALIZATION_VERSION}")
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        if rows:
+            logger.info(f"Re-normalized the intents of {len(rows)} run(s) in the run index")
+
+    def start_run(self, run_id: str, user_intent: str, priority: int = 0, tier: str = 'full') -> None:
+        """Record a new run; priority tells interactive requests (0) from background work like batches,
+        and tier is the load-shedding tier it is generated at."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO runs (run_id, user_intent, normalized_intent, status, priority, tier, created_at, updated_at) "
+                "VALUES (?, ?, ?, 'running', ?, ?, ?, ?) "
+                "ON CONFLICT (run_id) DO UPDATE SET status = 'running', updated_at = excluded.updated_at",
+                (run_id, user_intent, normalize_intent(user_intent), priority, tier, now, now),
+            )
+            self._pending_timings[run_id] = {}
+            while len(self._pending_timings) > MAX_BUFFERED_RUNS:
+                self._pending_timings.popitem(last=False)
+
+    def update_run(self, run_id: str, **fields) -> None:
+        """Update columns of a run (status, title, explanation, document_path, error) and flush its timings."""
+        if 'explanation' in fields and not isinstance(fields['explanation'], (str, type(None))):
+            fields['explanation'] = json.dumps(fields['explanation'], ensure_ascii=False)
+        with self._lock:
+            timings = self._pending_timings.get(run_id)
+            if timings:
+                self._pending_timings[run_id] = {}
+                row = self._conn.execute("SELECT timings FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+                merged = json.loads(row['timings']) if row else {}
+                for stage, seconds in timings.items():
+                    merged[stage] = round(merged.get(stage, 0) + seconds, 4)
+                fields['timings'] = json.dumps(merged)
+            if not fields:
+                return
+            assignments = ', '.join(f"{column} = ?" for column in fields)
+            self._conn.execute(
+                f"UPDATE runs SET {assignments}, updated_at = ? WHERE run_id = ?",
+                (*fields.values(), time.time(), run_id),
+            )
+
+    def record_timing(self, run_id: str, stage: str, seconds: float) -> None:
+        """Add a stage duration to a run; repeated stages (e.g. one per image) accumulate."""
+        with self._lock:
+            pending = self._pending_timings.get(run_id)
+            if pending is not None:
+                pending[stage] = pending.get(stage, 0) + seconds
+
+    def set_step(self, run_id: str, step_number: int, status: str, blob: Optional[str] = None,
+                 seconds: Optional[float] = None, error: Optional[str] = None, attempts: int = 0) -> None:
+        """Record the image status of one step ("ok", "reused", "retrying", "failed" or "deferred")."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO steps (run_id, step_number, status, blob, seconds, error, attempts, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (run_id, step_number) DO UPDATE SET status = excluded.status, blob = excluded.blob, "
+                "seconds = excluded.seconds, error = excluded.error, attempts = excluded.attempts, "
+                "updated_at = excluded.updated_at",
+                (run_id, step_number, status, blob, seconds, error, attempts, time.time()),
+            )
+
+    def record_image(self, digest: str, prompt_key: str, dhash: int) -> None:
+        """Record the perceptual hash of a post-processed blob and the prompt it was generated for."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO images (digest, prompt_key, dhash, created_at) VALUES (?, ?, ?, ?)",
+                (digest, prompt_key, f"{dhash:x}", time.time()),
+            )
+
+    def image_hashes(self, prompt_key: str) -> Dict[str, int]:
+        """Return the perceptual hash of every post-processed blob generated for a prompt."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT digest, dhash FROM images WHERE prompt_key = ?", (prompt_key,)
+            ).fetchall()
+        return {row['digest']: int(row['dhash'], 16) for row in rows}
+
+    def blob_in_use(self, digest: str) -> bool:
+        """Return whether any step refers to a blob."""
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM steps WHERE blob = ? LIMIT 1", (digest,)).fetchone() is not None
+
+    def _row_to_run(self, row: sqlite3.Row) -> Dict:
+        run = dict(row)
+        run['timings'] = json.loads(run['timings'])
+        run['explanation'] = json.loads(run['explanation']) if run['explanation'] else None
+        return run
+
+    def get_run(self, run_id: str) -> Optional[Dict]:
+        """Return a run with its steps, or None if it is not indexed."""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+            if row is None:
+                return None
+            steps = self._conn.execute(
+                "SELECT step_number, status, blob, seconds, error, attempts FROM steps WHERE run_id = ? ORDER BY step_number",
+                (run_id,),
+            ).fetchall()
+        run = self._row_to_run(row)
+        run['steps'] = [dict(step) for step in steps]
+        return run
+
+    def step_blobs(self, run_id: str) -> Dict[int, str]:
+        """Return the blob digest of every step with a stored image."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT step_number, blob FROM steps WHERE run_id = ? AND blob IS NOT NULL", (run_id,)
+            ).fetchall()
+        return {row['step_number']: row['blob'] for row in rows}
+
+    def started_steps(self, run_id: str) -> Set[int]:
+        """Return the numbers of the steps of a run whose image was attempted, whatever its outcome."""
+        with self._lock:
+            rows = self._conn.execute("SELECT step_number FROM steps WHERE run_id = ?", (run_id,)).fetchall()
+        return {row['step_number'] for row in rows}
+
+    def step_images(self, run_id: str) -> Dict[int, Path]:
+        """Return the image path of every step that has one in the given run."""
+        blobs = self.step_blobs(run_id)
+        store = get_image_store()
+        if not blobs:
+            # Runs from before the index kept their step images in a JSON manifest
+            return store.resolve_run(run_id)
+        return {step_number: store.blob_path(digest) for step_number, digest in blobs.items()}
+
+    def list_runs(self, limit: int = 20, offset: int = 0, status: Optional[str] = None) -> List[Dict]:
+        """Return the most recent runs, newest first."""
+        query = "SELECT * FROM runs"
+        params: list = []
+        if status is not None:
+            query += " WHERE status = ?"
+            params.append(status)
+        query += " ORDER BY created_at DESC LIMIT ? OFFSET ?"
+        with self._lock:
+            rows = self._conn.execute(query, (*params, limit, offset)).fetchall()
+        return [self._row_to_run(row) for row in rows]
+
+    def search_runs(self, text: str, limit: int = 20) -> List[Dict]:
+        """Return recent runs whose intent or title contains the given text."""
+        pattern = f"%{normalize_intent(text)}%"
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM runs WHERE normalized_intent LIKE ? OR lower(title) LIKE ? "
+                "ORDER BY created_at DESC LIMIT ?",
+                (pattern, pattern, limit),
+            ).fetchall()
+        return [self._row_to_run(row) for row in rows]
+
+    def runs_updated_since(self, since: float, status: str = 'ok') -> List[Dict]:
+        """Return the id, intent and update time of runs with the given status updated at or after since, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT run_id, user_intent, updated_at FROM runs WHERE updated_at >= ? AND status = ? "
+                "ORDER BY updated_at",
+                (since, status),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def popular_intents(self, since: float, limit: int = 20, max_priority: int = 0) -> List[Dict]:
+        """Return the most requested intents since a time, most requested first.
+
+        Only runs at max_priority or more urgent count as requests, so batch and
+        cache-warming runs do not make their own intents look popular. Each row has
+        the normalized intent, its latest spelling, the request count and the time
+        of the last request.
+        """
+        with self._lock:
+            # With MAX(), SQLite takes the bare user_intent column from the latest run
+            rows = self._conn.execute(
+                "SELECT normalized_intent, user_intent, COUNT(*) AS requests, MAX(created_at) AS last_requested_at "
+                "FROM runs WHERE created_at >= ? AND priority <= ? GROUP BY normalized_intent "
+                "ORDER BY requests DESC, last_requested_at DESC LIMIT ?",
+                (since, max_priority, limit),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def latest_run(self, user_intent: str, status: str = 'ok') -> Optional[Dict]:
+        """Return the most recent run for an intent (after normalization) with the given status."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM runs WHERE normalized_intent = ? AND status = ? ORDER BY created_at DESC LIMIT 1",
+                (normalize_intent(user_intent), status),
+            ).fetchone()
+        return self._row_to_run(row) if row else None
+
+_run_index: Optional[RunIndex] = None
+_run_index_lock = threading.Lock()
+
+def get_run_index() -> RunIndex:
+    """Return the process-wide run index."""
+    global _run_index
+    with _run_index_lock:
+        if _run_index is None:
+            _run_index = RunIndex(ConfigManager().get('run_index.path'))
+    return _run_index
+
+def _record_span(stage: str, trace_id: Optional[str], duration: float, status: str) -> None:
+    if trace_id:
+        get_run_index().record_timing(trace_id, stage, duration)
+
+add_span_listener(_record_span)
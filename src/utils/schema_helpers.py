@@ -0,0 +1,303 @@
+import json
+import logging
+from typing import Annotated, Callable, Dict, List, Optional, Tuple, Union
+from pydantic import BaseModel, Field, ValidationError
+from config.config_manager import ConfigManager
+from utils.metrics_helpers import metrics, span
+from utils.yaml_helpers import extract_yaml_fields, parse_yaml_response
+
+logger = logging.getLogger(__name__)
+
+NonEmptyStr = Annotated[str, Field(min_length=1)]
+
+class Step(BaseModel):
+    step_number: int
+    heading: NonEmptyStr
+    text: NonEmptyStr
+    image_description: NonEmptyStr
+    transition: Optional[str] = None
+
+class Explanation(BaseModel):
+    title: NonEmptyStr
+    introduction: NonEmptyStr
+    steps: List[Step] = Field(min_length=1)
+    conclusion: NonEmptyStr
+
+# Strict-mode JSON schema sent with chat.output_format "json_schema". Step fields are
+# ordered so image_description is generated before transition.
+EXPLANATION_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'title': {'type': 'string'},
+        'introduction': {'type': 'string'},
+        'steps': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'step_number': {'type': 'integer'},
+                    'heading': {'type': 'string'},
+                    'text': {'type': 'string'},
+                    'image_description': {'type': 'string'},
+                    'transition': {'type': ['string', 'null']},
+                },
+                'required': ['step_number', 'heading', 'text', 'image_description', 'transition'],
+                'additionalProperties': False,
+            },
+        },
+        'conclusion': {'type': 'string'},
+    },
+    'required': ['title', 'introduction', 'steps', 'conclusion'],
+    'additionalProperties': False,
+}
+
+REPAIRABLE_FIELDS = ('title', 'introduction', 'conclusion', 'heading', 'text', 'image_description')
+
+metrics.describe('simplifygpt_repaired_fields_total', 'Explanation fields fixed after validation, by how.')
+metrics.describe('simplifygpt_invalid_responses_total', 'Completions that could not be turned into a valid explanation.')
+
+def json_schema_response_format(name: str, schema: Dict) -> Dict:
+    return {'type': 'json_schema', 'json_schema': {'name': name, 'strict': True, 'schema': schema}}
+
+def uses_structured_output() -> bool:
+    return ConfigManager().get('chat.output_format') == 'json_schema'
+
+class JsonStepStreamParser:
+    """Incrementally parse a streamed JSON explanation into steps.
+
+    The JSON counterpart of StepStreamParser: a step is reported as soon as its
+    object in the "steps" array closes, and top-level string fields are passed to
+    on_field(name, value) as soon as their value closes.
+    """
+
+    def __init__(self, on_field: Optional[Callable[[str, str], None]] = None):
+        self._on_field = on_field
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string: List[str] = []
+        self._last_key: Optional[str] = None
+        self._expect_value = False
+        self._in_steps = False
+        self._step: Optional[List[str]] = None
+        self._emitted = set()
+
+    def feed(self, chunk: str) -> List[Dict]:
+        """Feed a chunk of streamed text and return steps completed by it."""
+        completed = []
+        for char in chunk:
+            if self._step is not None:
+                self._step.append(char)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._close_string()
+                elif self._depth == 1:
+                    self._string.append(char)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string = []
+            elif char == ':' and self._depth == 1:
+                self._expect_value = True
+            elif char == ',' and self._depth == 1:
+                self._expect_value = False
+            elif char in '{[':
+                self._expect_value = False
+                self._depth += 1
+                if char == '[' and self._depth == 2 and self._last_key == 'steps':
+                    self._in_steps = True
+                elif char == '{' and self._in_steps and self._depth == 3:
+                    self._step = ['{']
+            elif char in '}]':
+                if char == '}' and self._step is not None and self._depth == 3:
+                    completed.extend(self._emit(''.join(self._step)))
+                    self._step = None
+                elif char == ']' and self._depth == 2:
+                    self._in_steps = False
+                self._depth -= 1
+        return completed
+
+    def close(self) -> List[Dict]:
+        """Steps are reported as their objects close, so nothing is left to flush."""
+        return []
+
+    def _close_string(self) -> None:
+        raw = ''.join(self._string)
+        if not self._expect_value:
+            self._last_key = raw
+            return
+        self._expect_value = False
+        if self._on_field is not None:
+            try:
+                self._on_field(self._last_key, json.loads(f'"{raw}"'))
+            except json.JSONDecodeError:
+                logger.debug(f"Could not decode streamed field {self._last_key}")
+
+    def _emit(self, text: str) -> List[Dict]:
+        try:
+            step = json.loads(text)
+            step_number = int(step['step_number'])
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Could not parse streamed step: {e}")
+            return []
+        if not step.get('image_description') or step_number in self._emitted:
+            return []
+
+        self._emitted.add(step_number)
+        step['step_number'] = step_number
+        logger.debug(f"[Step {step_number}] Image description complete in stream")
+        return [step]
+
+def make_step_parser(on_field: Optional[Callable[[str, str], None]] = None):
+    """Return the incremental step parser for the configured output format."""
+    from utils.yaml_helpers import StepStreamParser
+    parser_class = JsonStepStreamParser if uses_structured_output() else StepStreamParser
+    return parser_class(on_field)
+
+def _get_field(data: Dict, loc: Tuple):
+    value = data
+    for part in loc:
+        if isinstance(value, dict):
+            value = value.get(part)
+        elif isinstance(value, list) and isinstance(part, int) and part < len(value):
+            value = value[part]
+        else:
+            return None
+    return value
+
+def _set_field(data: Dict, loc: Tuple, value) -> None:
+    _get_field(data, loc[:-1])[loc[-1]] = value
+
+def _field_key(loc: Tuple) -> str:
+    return '.'.join(str(part) for part in loc)
+
+def _fix_locally(data: Dict, loc: Tuple) -> bool:
+    """Fix an invalid field without calling the model; return False if it must be regenerated."""
+    in_step = len(loc) == 3 and loc[0] == 'steps'
+    if in_step and loc[2] == 'step_number':
+        _set_field(data, loc, loc[1] + 1)
+        return True
+    if in_step and loc[2] == 'transition':
+        _set_field(data, loc, None)
+        return True
+    value = _get_field(data, loc)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        _set_field(data, loc, str(value))
+        return True
+    return False
+
+def validate_explanation(data: Dict) -> Tuple[Optional[Explanation], List[Tuple]]:
+    """Validate a parsed response, fixing what can be fixed locally.
+
+    Returns the typed explanation, or None and the locations of the fields that
+    need regenerating. A location list containing anything other than a single
+    text field (e.g. a missing steps list) means the response cannot be repaired.
+    """
+    for _ in range(2):
+        try:
+            return Explanation.model_validate(data), []
+        except ValidationError as e:
+            locs = [error['loc'] for error in e.errors()]
+        remaining = [loc for loc in locs if not _fix_locally(data, loc)]
+        fixed = len(locs) - len(remaining)
+        if fixed:
+            metrics.inc('simplifygpt_repaired_fields_total', fixed, method='local')
+        if remaining:
+            return None, remaining
+    return None, locs
+
+def _is_repairable(loc: Tuple) -> bool:
+    if len(loc) == 1:
+        return loc[0] in REPAIRABLE_FIELDS
+    return len(loc) == 3 and loc[0] == 'steps' and isinstance(loc[1], int) and loc[2] in REPAIRABLE_FIELDS
+
+async def repair_fields_async(data: Dict, locs: List[Tuple], user_intent: str, run_id: Optional[str] = None) -> bool:
+    """Regenerate only the given fields with one small completion, filling them into data."""
+    from utils.openai_helpers import get_json_completion_async
+    from utils.prompt_helpers import get_prompt_registry
+
+    keys = [_field_key(loc) for loc in locs]
+    prompt = get_prompt_registry().get(ConfigManager().get('openai.repair_prompt_path')).render(
+        user_intent=user_intent,
+        explanation=json.dumps(data, ensure_ascii=False, default=str),
+        fields='\n'.join(f"- {key}" for key in keys),
+    )
+    schema = {
+        'type': 'object',
+        'properties': {key: {'type': 'string'} for key in keys},
+        'required': keys,
+        'additionalProperties': False,
+    }
+    with span('repair', trace_id=run_id):
+        values = await get_json_completion_async(
+            [{"role": "user", "content": prompt}], 'explanation_repair', schema, run_id
+        )
+
+    for loc, key in zip(locs, keys):
+        value = values.get(key)
+        if not isinstance(value, str) or not value:
+            logger.warning(f"Repair did not return field {key}")
+            return False
+        _set_field(data, loc, value)
+    metrics.inc('simplifygpt_repaired_fields_total', len(locs), method='model')
+    logger.info(f"Repaired {len(locs)} field(s) with the model: {', '.join(keys)}")
+    return True
+
+def _parse_structured(response_text: str) -> Union[Dict, str]:
+    """Parse a JSON response, stripping a code fence if the model added one."""
+    text = response_text.strip()
+    if text.startswith('```'):
+        text = text.split('\n', 1)[-1].rsplit('```', 1)[0]
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        logger.error(f"Error parsing JSON response: {e}")
+        return response_text
+    return data if isinstance(data, dict) else response_text
+
+def parse_explanation(response_text: str, user_intent: Optional[str] = None, run_id: Optional[str] = None) -> Union[Dict, str]:
+    """Parse and validate a completion into an explanation dict.
+
+    Structured (JSON) output is validated straight into the typed model. Otherwise,
+    or if that fails, the response is parsed and its invalid fields are fixed
+    locally where possible; with a user_intent, the remaining text fields are
+    regenerated by the model instead of discarding the whole response. Returns
+    the raw response if it cannot be turned into a valid explanation.
+    """
+    if uses_structured_output():
+        with span('parse'):
+            try:
+                return Explanation.model_validate_json(response_text).model_dump(exclude_none=True)
+            except ValidationError:
+                data = _parse_structured(response_text)
+    else:
+        data = parse_yaml_response(response_text)
+
+    if not isinstance(data, dict):
+        logger.warning("Falling back to field-by-field extraction of the response")
+        data = extract_yaml_fields(response_text)
+
+    with span('validate'):
+        explanation, locs = validate_explanation(data)
+
+    if explanation is None and user_intent and locs and all(_is_repairable(loc) for loc in locs):
+        if ConfigManager().get('chat.repair_fields'):
+            from utils.client_helpers import run_async
+            try:
+                if run_async(repair_fields_async(data, locs, user_intent, run_id)):
+                    explanation, locs = validate_explanation(data)
+            except Exception as e:
+                logger.error(f"Field repair failed: {e}")
+
+    if explanation is None:
+        logger.error(f"Response failed validation at: {', '.join(_field_key(loc) for loc in locs)}")
+        metrics.inc('simplifygpt_invalid_responses_total')
+        return response_text
+    return explanation.model_dump(exclude_none=True)
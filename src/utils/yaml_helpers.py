@@ -1,6 +1,8 @@
+import re
 import yaml
 import logging
-from typing import Union, Dict
+from typing import Callable, Union, Dict, List, Optional
+from utils.metrics_helpers import metrics, span
 
 logger = logging.getLogger(__name__)
 
@@ -61,6 +63,10 @@ def fix_yaml_indentation(yaml_str: str) -> str:
 
 def parse_yaml_response(yaml_str: str) -> Union[Dict, str]:
     """Parse YAML string to dictionary."""
+    with span('parse'):
+        return _parse_yaml_response(yaml_str)
+
+def _parse_yaml_response(yaml_str: str) -> Union[Dict, str]:
     try:
         cleaned_str = yaml_str
         if cleaned_str.startswith('```yaml'):
@@ -86,4 +92,164 @@ def parse_yaml_response(yaml_str: str) -> Union[Dict, str]:
             
     except yaml.YAMLError as e:
         logger.error(f"Error parsing YAML: {e}\nInput that caused error:\n{'-' * 50}\n{cleaned_str}\n{'-' * 50}")
-        return yaml_str
\ No newline at end of file
+        metrics.inc('simplifygpt_parse_failures_total')
+        return yaml_str
+
+STEP_KEYS = ('step_number', 'heading', 'text', 'image_description', 'transition')
+_STEP_START_RE = re.compile(r'^\s*-\s*step_number:')
+_STEP_KEY_RE = re.compile(r'^\s*-?\s*(' + '|'.join(STEP_KEYS) + r'):\s?(.*)$')
+_TOP_LEVEL_KEY_RE = re.compile(r'^[A-Za-z_]+:')
+
+def _parse_scalar(lines: List[str]) -> str:
+    """Parse the raw lines of a single YAML value into a string."""
+    if lines and lines[0].strip() in ('>', '|', '>-', '|-'):
+        lines = lines[1:]
+    raw = clean_yaml_string(' '.join(line.strip() for line in lines).strip())
+    try:
+        value = yaml.safe_load(f"value: {raw}")['value']
+    except (yaml.YAMLError, TypeError):
+        # Usually unescaped quotes inside a quoted value; keep the inner text as-is
+        if len(raw) >= 2 and raw[0] == raw[-1] and raw[0] in '"\'':
+            value = raw[1:-1]
+        else:
+            value = raw
+    return value if value is not None else ''
+
+def extract_yaml_fields(yaml_str: str) -> Dict:
+    """Recover an explanation field by field when the document as a whole is not valid YAML.
+
+    Each value is parsed on its own, so one badly quoted field does not cost the
+    rest of the response. Fields that cannot be found are simply absent.
+    """
+    result: Dict = {}
+    steps: List[Dict[str, List[str]]] = []
+    current: Optional[Dict[str, List[str]]] = None
+    key: Optional[str] = None
+
+    for line in clean_yaml_string(yaml_str).split('\n'):
+        stripped = line.strip()
+        if not stripped or stripped.startswith(('```', '#')):
+            continue
+        step_match = _STEP_KEY_RE.match(line)
+        top_match = _TOP_LEVEL_KEY_RE.match(line)
+        if _STEP_START_RE.match(line):
+            current = {}
+            steps.append(current)
+        elif top_match and not step_match:
+            current = None
+            name, _, value = line.partition(':')
+            key = name.strip()
+            result[key] = [value]
+            continue
+
+        if step_match and current is not None:
+            key, value = step_match.groups()
+            current[key] = [value]
+        elif key is not None:
+            (current if current is not None else result)[key].append(stripped)
+
+    explanation = {name: _parse_scalar(lines) for name, lines in result.items() if name != 'steps'}
+    if steps:
+        explanation['steps'] = [{name: _parse_scalar(lines) for name, lines in step.items()} for step in steps]
+    return explanation
+
+class StepStreamParser:
+    """Incrementally parse a streamed YAML explanation into steps.
+
+    Chunks are fed as they arrive from the model. A step is reported as soon as
+    its image_description is complete, i.e. when the next key of the same step,
+    the next step, or the next top-level section starts. Top-level fields such as
+    the title are passed to on_field(name, value) once complete.
+    """
+
+    def __init__(self, on_field: Optional[Callable[[str, str], None]] = None):
+        self._buffer = ''
+        self._step: Optional[Dict[str, List[str]]] = None
+        self._key: Optional[str] = None
+        self._emitted = set()
+        self._on_field = on_field
+        self._field: Optional[str] = None
+        self._field_lines: List[str] = []
+
+    def feed(self, chunk: str) -> List[Dict]:
+        """Feed a chunk of streamed text and return steps completed by it."""
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split('\n')
+        completed = []
+        for line in lines:
+            completed.extend(self._process_line(line))
+        return completed
+
+    def close(self) -> List[Dict]:
+        """Flush any buffered text at the end of the stream."""
+        completed = []
+        if self._buffer:
+            completed.extend(self._process_line(self._buffer))
+            self._buffer = ''
+        completed.extend(self._finish_step())
+        self._finish_field()
+        return completed
+
+    def _finish_field(self) -> None:
+        if self._field is not None and self._field != 'steps' and self._on_field is not None:
+            self._on_field(self._field, _parse_scalar(self._field_lines))
+        self._field = None
+        self._field_lines = []
+
+    def _process_line(self, line: str) -> List[Dict]:
+        stripped = line.strip()
+        if not stripped or stripped.startswith(('```', '#')):
+            return []
+
+        completed = []
+        if _STEP_START_RE.match(line):
+            self._finish_field()
+            completed.extend(self._finish_step())
+            self._step = {}
+        elif _TOP_LEVEL_KEY_RE.match(line) and not _STEP_KEY_RE.match(line):
+            self._finish_field()
+            completed.extend(self._finish_step())
+            name, _, value = line.partition(':')
+            self._field = name.strip()
+            self._field_lines = [value]
+            return completed
+
+        if self._step is None:
+            if self._field is not None:
+                self._field_lines.append(stripped)
+            return completed
+
+        match = _STEP_KEY_RE.match(line)
+        if match:
+            key, value = match.groups()
+            if self._key == 'image_description' and key != 'image_description':
+                completed.extend(self._emit())
+            self._key = key
+            self._step[key] = [value]
+        elif self._key:
+            self._step[self._key].append(stripped)
+        return completed
+
+    def _emit(self) -> List[Dict]:
+        step = self._step or {}
+        if 'step_number' not in step or 'image_description' not in step:
+            return []
+        try:
+            step_number = int(_parse_scalar(step['step_number']))
+        except (TypeError, ValueError):
+            logger.warning(f"Could not parse streamed step number: {step['step_number']}")
+            return []
+        if step_number in self._emitted:
+            return []
+
+        self._emitted.add(step_number)
+        parsed = {key: _parse_scalar(lines) for key, lines in step.items() if key != 'step_number'}
+        parsed['step_number'] = step_number
+        logger.debug(f"[Step {step_number}] Image description complete in stream")
+        return [parsed]
+
+    def _finish_step(self) -> List[Dict]:
+        completed = self._emit()
+        self._step = None
+        self._key = None
+        return completed
@@ -0,0 +1,100 @@
+from utils import setup_logging, start_metrics, generate_explanation, get_run_index, is_completion_cached, metrics, PRIORITY_BACKGROUND
+from utils.rate_limiter import request_priority
+from config.config_manager import ConfigManager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List
+import argparse
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+metrics.describe('simplifygpt_cache_warm_runs_total', 'Concepts handled by the cache warming job, by outcome.')
+
+def select_intents(window_hours: float, top_n: int, min_requests: int) -> List[Dict]:
+    """Return the most requested recent intents whose completion is not cached yet, most requested first."""
+    since = time.time() - window_hours * 3600
+    popular = get_run_index().popular_intents(since, limit=top_n)
+    selected = []
+    for row in popular:
+        if row['requests'] < min_requests:
+            break
+        if is_completion_cached(row['user_intent']):
+            logger.debug(f"Already warm: '{row['user_intent']}' ({row['requests']} requests)")
+            continue
+        selected.append(row)
+    logger.info(f"Cache warming: {len(popular)} popular intents in the last {window_hours}h, {len(selected)} to warm")
+    return selected
+
+def warm_intent(user_intent: str, deadline: float) -> Dict:
+    """Generate one intent through the normal pipeline, unless the time budget is already spent."""
+    record = {'intent': user_intent}
+    if time.monotonic() >= deadline:
+        record['status'] = 'over_budget'
+        return record
+    # Warming runs yield to interactive sessions and are not counted as requests
+    request_priority.set(PRIORITY_BACKGROUND)
+    start_time = time.time()
+    try:
+        # The completion is known to be uncached. No refresh: stored images are reused, and an intent
+        # that dedup "serve" answers from a similar past run needs no warming
+        result = generate_explanation(user_intent)
+        record['run_id'] = result['run_id']
+        record['status'] = 'ok' if isinstance(result['parsed_response'], dict) else 'parse_error'
+    except Exception as e:
+        logger.error(f"Warming '{user_intent}' failed: {e}", exc_info=True)
+        record['status'] = 'error'
+        record['error'] = str(e)
+    record['duration'] = round(time.time() - start_time, 2)
+    return record
+
+def warm_cache(intents: List[str], concurrency: int, max_seconds: float) -> Dict:
+    """Pre-generate intents with bounded concurrency; those not started within max_seconds are skipped."""
+    deadline = time.monotonic() + max_seconds
+    counts = {'ok': 0, 'parse_error': 0, 'error': 0, 'over_budget': 0}
+    start_time = time.time()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(warm_intent, intent, deadline) for intent in intents]
+        for done, future in enumerate(as_completed(futures), start=1):
+            record = future.result()
+            counts[record['status']] += 1
+            metrics.inc('simplifygpt_cache_warm_runs_total', status=record['status'])
+            if record['status'] != 'over_budget':
+                logger.info(f"[{done}/{len(intents)}] {record['status']}: {record['intent']} ({record['duration']:.2f}s)")
+
+    logger.info(f"Cache warming finished in {time.time() - start_time:.2f}s: {counts}")
+    return counts
+
+def main():
+    config = ConfigManager()
+    parser = argparse.ArgumentParser(
+        description="Pre-generate the most requested recent concepts so they are served from cache."
+    )
+    parser.add_argument('--window-hours', type=float, default=config.get('warm_cache.window_hours'),
+                        help="How far back to count requests")
+    parser.add_argument('--top', type=int, default=config.get('warm_cache.top_n'),
+                        help="Number of most requested concepts to consider")
+    parser.add_argument('--min-requests', type=int, default=config.get('warm_cache.min_requests'),
+                        help="Skip concepts requested fewer times than this")
+    parser.add_argument('--concurrency', type=int, default=config.get('warm_cache.concurrency'),
+                        help="Number of concepts generated in parallel")
+    parser.add_argument('--max-seconds', type=float, default=config.get('warm_cache.max_seconds'),
+                        help="Time budget; concepts not started by then are left for the next run")
+    parser.add_argument('--dry-run', action='store_true', help="Only list the concepts that would be warmed")
+    args = parser.parse_args()
+
+    selected = select_intents(args.window_hours, args.top, args.min_requests)
+    if args.dry_run:
+        for row in selected:
+            print(f"{row['requests']:>5}  {row['user_intent']}")
+        return
+
+    counts = warm_cache([row['user_intent'] for row in selected], args.concurrency, args.max_seconds)
+    print(f"\nWarmed {counts['ok']} concepts, {counts['parse_error'] + counts['error']} failed, "
+          f"{counts['over_budget']} left over budget.")
+
+if __name__ == "__main__":
+    setup_logging('warm_cache')
+    start_metrics()
+    main()
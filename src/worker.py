@@ -0,0 +1,176 @@
+from utils import setup_logging, get_job_queue, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+from utils.rate_limiter import request_priority
+from config.config_manager import ConfigManager
+from typing import Any, Callable, Dict, List, Optional
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+def _explanation_job(user_intent: str, refresh: bool = False) -> Dict:
+    from utils import generate_explanation, get_document
+    result = generate_explanation(user_intent, refresh=refresh)
+    if isinstance(result['parsed_response'], dict):
+        result['document'] = str(get_document(result['parsed_response'], result['run_id']))
+    return result
+
+def _completion_job(user_intent: str) -> str:
+    from utils import get_completion
+    return get_completion(user_intent)
+
+def _images_job(explanation: Dict, user_intent: str, run_id: Optional[str] = None) -> str:
+    from utils import generate_and_save_images
+    return generate_and_save_images(explanation, user_intent, run_id)
+
+def _display_job(explanation: Dict, user_intent: str, run_id: Optional[str] = None) -> str:
+    from utils import display_explanation
+    return display_explanation(explanation, user_intent, run_id)
+
+def _regenerate_images_job(run_id: str, step_numbers: Optional[List[int]] = None) -> Dict:
+    from utils import regenerate_images
+    return {step_number: str(path) if path else None for step_number, path in regenerate_images(run_id, step_numbers).items()}
+
+def _regenerate_step_job(run_id: str, step_number: int) -> Dict:
+    from utils import regenerate_step_text
+    return regenerate_step_text(run_id, step_number)
+
+# Job kind -> handler called with the job's payload as keyword arguments
+JOB_HANDLERS: Dict[str, Callable[..., Any]] = {
+    'explanation': _explanation_job,
+    'completion': _completion_job,
+    'images': _images_job,
+    'display': _display_job,
+    'regenerate_images': _regenerate_images_job,
+    'regenerate_step': _regenerate_step_job,
+}
+
+def process_job(job: Dict, worker: str) -> None:
+    """Run one claimed job, renewing its lease until it finishes, and record the outcome."""
+    queue = get_job_queue()
+    done = threading.Event()
+
+    def renew_lease() -> None:
+        while not done.wait(queue.lease_seconds / 3):
+            if not queue.renew(job['job_id'], worker):
+                logger.warning(f"Lost the lease on job {job['job_id']}")
+                return
+
+    threading.Thread(target=renew_lease, name="job-lease", daemon=True).start()
+    start_time = time.time()
+    request_priority.set(job['priority'])
+    try:
+        result = JOB_HANDLERS[job['kind']](**job['payload'])
+        if queue.complete(job['job_id'], worker, result):
+            logger.info(f"Job {job['job_id']} ({job['kind']}) done in {time.time() - start_time:.2f}s")
+    except Exception as e:
+        status = queue.fail(job['job_id'], worker, str(e))
+        logger.error(f"Job {job['job_id']} ({job['kind']}) failed, now {status or 'held by another worker'}: {e}", exc_info=True)
+    finally:
+        done.set()
+
+def run_worker(worker: str, kinds: Optional[List[str]], poll_interval: float, stop: Any) -> None:
+    """Claim and process jobs until stop is set; the current job is always finished first."""
+    queue = get_job_queue()
+    logger.info(f"Worker {worker} started")
+    while not stop.is_set():
+        job = queue.claim(worker, kinds)
+        if job is None:
+            stop.wait(poll_interval)
+            continue
+        logger.info(f"Worker {worker} claimed job {job['job_id']} ({job['kind']}, attempt {job['attempts']})")
+        process_job(job, worker)
+    logger.info(f"Worker {worker} stopped")
+
+def _worker_process(index: int, kinds: Optional[List[str]], poll_interval: float, stop: Any) -> None:
+    # Ctrl-C goes to the parent, which asks every worker to stop after its current job
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    setup_logging('worker')
+    run_worker(f"{socket.gethostname()}:{os.getpid()}:{index}", kinds, poll_interval, stop)
+
+def run_workers(processes: int, kinds: Optional[List[str]], poll_interval: float) -> None:
+    """Start worker processes and stop them gracefully on SIGINT/SIGTERM."""
+    context = multiprocessing.get_context('spawn')
+    stop = context.Event()
+    workers = [
+        context.Process(target=_worker_process, args=(index, kinds, poll_interval, stop), name=f"worker-{index}")
+        for index in range(processes)
+    ]
+    for process in workers:
+        process.start()
+    logger.info(f"Started {processes} worker process(es)")
+
+    def request_stop(signum, frame) -> None:
+        logger.info("Stopping workers after their current jobs")
+        stop.set()
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+    for process in workers:
+        process.join()
+
+def main():
+    config = ConfigManager()
+    parser = argparse.ArgumentParser(description="Generation workers and the persistent job queue they serve.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="Start worker processes")
+    run_parser.add_argument('--processes', type=int, default=config.get('jobs.processes'),
+                            help="Number of worker processes")
+    run_parser.add_argument('--kinds', nargs='*', choices=sorted(JOB_HANDLERS),
+                            help="Only process these job kinds")
+    run_parser.add_argument('--poll-interval', type=float, default=config.get('jobs.poll_interval'),
+                            help="Seconds to wait before checking an empty queue again")
+
+    submit_parser = subparsers.add_parser('submit', help="Queue an explanation job for a concept")
+    submit_parser.add_argument('user_intent', help="Concept to explain")
+    submit_parser.add_argument('--background', action='store_true',
+                               help="Queue at background priority, behind interactive requests")
+    submit_parser.add_argument('--wait', action='store_true', help="Wait for the job and print its result")
+
+    regenerate_parser = subparsers.add_parser(
+        'regenerate', help="Queue regeneration of a run's missing or failed images, or of one step"
+    )
+    regenerate_parser.add_argument('run_id')
+    regenerate_parser.add_argument('--step', type=int, help="Regenerate only this step's image")
+    regenerate_parser.add_argument('--text', action='store_true', help="Also rewrite the step's text (needs --step)")
+    regenerate_parser.add_argument('--wait', action='store_true', help="Wait for the job and print its result")
+
+    status_parser = subparsers.add_parser('status', help="Show a job, or queue totals without a job id")
+    status_parser.add_argument('job_id', nargs='?')
+    status_parser.add_argument('--wait', action='store_true', help="Wait for the job to finish")
+
+    args = parser.parse_args()
+    queue = get_job_queue()
+
+    if args.command == 'run':
+        run_workers(args.processes, args.kinds, args.poll_interval)
+    elif args.command in ('submit', 'regenerate'):
+        if args.command == 'submit':
+            priority = PRIORITY_BACKGROUND if args.background else PRIORITY_INTERACTIVE
+            job_id = queue.submit('explanation', {'user_intent': args.user_intent}, priority)
+        elif args.text:
+            if args.step is None:
+                parser.error("--text needs --step")
+            job_id = queue.submit('regenerate_step', {'run_id': args.run_id, 'step_number': args.step})
+        else:
+            step_numbers = [args.step] if args.step is not None else None
+            job_id = queue.submit('regenerate_images', {'run_id': args.run_id, 'step_numbers': step_numbers})
+        print(job_id)
+        if args.wait:
+            print(json.dumps(queue.wait(job_id), indent=2, ensure_ascii=False))
+    elif args.job_id:
+        job = queue.wait(args.job_id) if args.wait else queue.get(args.job_id)
+        print(json.dumps(job, indent=2, ensure_ascii=False) if job else f"Unknown job: {args.job_id}")
+    else:
+        print(json.dumps(queue.stats(), indent=2))
+
+if __name__ == "__main__":
+    setup_logging('worker')
+    main()